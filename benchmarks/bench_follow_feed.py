@@ -0,0 +1,102 @@
+"""Первая страница ленты подписок: JOIN через posts_follow против
+слияния кучей потоков отдельных авторов (FOLLOW_FEED_ENGINE='merge').
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_follow_feed.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+)
+from django.utils import timezone  # noqa: E402
+
+from core.utils import FEED_ORDERING  # noqa: E402
+from posts.feeds import AuthorMergeFeed  # noqa: E402
+from posts.models import Follow, Post, User  # noqa: E402
+
+AUTHORS = 1000
+POSTS_PER_AUTHOR = 20
+REPEAT = 20
+
+
+def populate() -> None:
+    User.objects.bulk_create(
+        User(username=f'author{index}') for index in range(AUTHORS)
+    )
+    authors = list(User.objects.all())
+    Post.objects.bulk_create(
+        Post(text='текст', author=author)
+        for author in authors
+        for _ in range(POSTS_PER_AUTHOR)
+    )
+    posts = list(Post.objects.all())
+    now = timezone.now()
+    for post in posts:
+        post.pub_date = now - timedelta(minutes=random.randrange(10 ** 6))
+    Post.objects.bulk_update(posts, ('pub_date',), batch_size=1000)
+    for followees in (10, 100, 1000):
+        reader = User.objects.create(username=f'reader{followees}')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author)
+            for author in random.sample(authors, followees)
+        )
+
+
+def measure(function) -> float:
+    return timeit.timeit(function, number=REPEAT) / REPEAT * 1000
+
+
+def main() -> None:
+    setup_test_environment()
+    setup_databases(verbosity=0, interactive=False)
+    populate()
+    size = settings.PAGE_SIZE + 1
+    print(f'{"подписок":>9} {"join, мс":>9} {"merge, мс":>10} {"холодный":>9}')
+    for followees in (10, 100, 1000):
+        reader = User.objects.get(username=f'reader{followees}')
+        author_ids = list(
+            Follow.objects.filter(user=reader).values_list(
+                'author',
+                flat=True,
+            ),
+        )
+        join = (
+            Post.objects.filter(author__following__user=reader)
+            .select_related('author', 'group')
+            .order_by(*FEED_ORDERING)
+        )
+        feed = AuthorMergeFeed(author_ids)
+        assert list(join[:size]) == feed[0:size]
+
+        def cold() -> None:
+            cache.clear()
+            feed[0:size]
+
+        print(
+            f'{followees:>9} '
+            f'{measure(lambda: list(join[:size])):>9.2f} '
+            f'{measure(lambda: feed[0:size]):>10.2f} '
+            f'{measure(cold):>9.2f}',
+        )
+
+
+if __name__ == '__main__':
+    main()
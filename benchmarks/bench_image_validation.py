@@ -0,0 +1,92 @@
+"""Задержка проверки загруженной картинки в форме поста.
+
+Сравнивает forms.ImageField из Django, который копирует загрузку в память
+и проходит по ней verify(), с проверкой PostForm по заголовку. Запуск из
+корня репозитория:
+
+    python benchmarks/bench_image_validation.py [повторов]
+"""
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django import forms  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from posts.forms import PostForm  # noqa: E402
+from posts.tests import common  # noqa: E402
+
+SIZES = ((1280, 960), (3000, 2000), (6000, 4000))
+
+
+def corpus() -> Iterator[Tuple[str, str, bytes]]:
+    yield 'random.jpg', 'шум 180 КБ', common.image().read()
+    for width, height in SIZES:
+        gradient = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 40)
+        photo = Image.merge('RGB', (gradient, noise, gradient.rotate(180)))
+        for format_, options in (('JPEG', {'quality': 95}), ('PNG', {})):
+            buffer = BytesIO()
+            photo.save(buffer, format_, **options)
+            yield (
+                f'photo.{format_.lower()}',
+                f'{width}x{height} {format_}',
+                buffer.getvalue(),
+            )
+
+
+def measure(
+    clean: Callable[[SimpleUploadedFile], object],
+    name: str,
+    content: bytes,
+    repeat: int,
+) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        upload = SimpleUploadedFile(name, content)
+        started = time.perf_counter()
+        try:
+            clean(upload)
+        except forms.ValidationError:
+            pass
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def p99(timings: List[float]) -> float:
+    return statistics.quantiles(timings, n=100)[-1]
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    django_field = forms.ImageField()
+    post_field = PostForm().fields['image']
+    print(
+        f'{"файл":>18} {"КБ":>7} {"Django p50":>11} {"p99":>7} '
+        f'{"заголовок p50":>14} {"p99":>7}',
+    )
+    for name, label, content in corpus():
+        full = measure(django_field.clean, name, content, repeat)
+        header = measure(post_field.clean, name, content, repeat)
+        print(
+            f'{label:>18} {len(content) / 1024:>7.0f} '
+            f'{statistics.median(full):>11.2f} {p99(full):>7.2f} '
+            f'{statistics.median(header):>14.2f} {p99(header):>7.2f}',
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Время рендера includes/paginator.html в зависимости от числа страниц.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_paginator.py
+"""
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.paginator import Paginator  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+REPEAT = 200
+
+
+def main() -> None:
+    template = get_template('includes/paginator.html')
+    print(f'{"страниц":>10} {"мс/рендер":>10} {"байт":>8}')
+    for num_pages in (10, 1_000, 100_000, 1_000_000):
+        paginator = Paginator(
+            range(num_pages * settings.PAGE_SIZE),
+            settings.PAGE_SIZE,
+        )
+        page = paginator.page(num_pages // 2)
+        context = {'page_obj': page}
+        html = template.render(context)
+        seconds = timeit.timeit(
+            lambda: template.render(context),
+            number=REPEAT,
+        )
+        milliseconds = seconds / REPEAT * 1000
+        print(f'{num_pages:>10} {milliseconds:>10.3f} {len(html):>8}')
+
+
+if __name__ == '__main__':
+    main()
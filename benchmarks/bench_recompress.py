@@ -0,0 +1,75 @@
+"""Время и выигрыш в байтах от пережатия картинок при загрузке.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_recompress.py [каталог с картинками]
+
+Без каталога картинки генерируются: шум поверх градиента, похожий по
+сжимаемости на фотографию, в нескольких размерах и форматах.
+"""
+import os
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from PIL import Image  # noqa: E402
+
+from posts import images  # noqa: E402
+
+SIZES = ((1280, 960), (3000, 2000), (6000, 4000))
+
+
+def synthetic_corpus() -> Iterator[Tuple[str, bytes]]:
+    for width, height in SIZES:
+        gradient = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 40)
+        photo = Image.merge('RGB', (gradient, noise, gradient.rotate(180)))
+        for format_, options in (('JPEG', {'quality': 95}), ('PNG', {})):
+            buffer = BytesIO()
+            photo.save(buffer, format_, **options)
+            yield f'{width}x{height}.{format_.lower()}', buffer.getvalue()
+
+
+def directory_corpus(path: Path) -> Iterator[Tuple[str, bytes]]:
+    for file in sorted(path.iterdir()):
+        if file.is_file():
+            yield file.name, file.read_bytes()
+
+
+def main() -> None:
+    corpus = (
+        directory_corpus(Path(sys.argv[1]))
+        if len(sys.argv) > 1
+        else synthetic_corpus()
+    )
+    format_ = images.output_format()
+    print(f'формат: {format_}')
+    print(f'{"файл":>16} {"КБ до":>9} {"КБ после":>9} {"доля":>6} {"мс":>7}')
+    total_in = total_out = 0
+    for name, content in corpus:
+        started = time.perf_counter()
+        with Image.open(BytesIO(content)) as source:
+            encoded = images.encode(source, format_)
+        elapsed = (time.perf_counter() - started) * 1000
+        total_in += len(content)
+        total_out += len(encoded)
+        print(
+            f'{name:>16} {len(content) / 1024:>9.0f} '
+            f'{len(encoded) / 1024:>9.0f} '
+            f'{len(encoded) / len(content):>6.1%} {elapsed:>7.1f}',
+        )
+    print(f'итого: {total_in / 2**20:.1f} МБ -> {total_out / 2**20:.1f} МБ')
+
+
+if __name__ == '__main__':
+    main()
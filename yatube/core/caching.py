@@ -0,0 +1,301 @@
+import hashlib
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Type
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Model, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_cookie
+
+
+# Только на такие запросы отвечают по ETag и из кэша страниц.
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def version_key(scope: str) -> str:
+    return f'listing_version:{scope}'
+
+
+def bump_versions(
+    scopes: Iterable[str],
+    timeout: Optional[int] = None,
+) -> None:
+    """Меняет поколение областей, делая их страницы в кэше недоступными."""
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.set(version_key(scope), time.time_ns(), timeout)
+
+
+def versions_of(
+    scopes: Iterable[str],
+    timeout: Optional[int] = None,
+) -> Dict[str, int]:
+    """Поколения областей; недостающие заводятся с текущего времени."""
+    keys = {version_key(scope): scope for scope in scopes}
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    cache.set_many(missing, timeout)
+    versions.update(missing)
+    return {scope: versions[key] for key, scope in keys.items()}
+
+
+def current_versions(scopes: Iterable[str]) -> str:
+    return '.'.join(str(version) for version in versions_of(scopes).values())
+
+
+def versions_etag(request: HttpRequest, versions: str) -> str:
+    """Слабый ETag страницы по поколениям её областей.
+
+    Страница зависит и от пользователя, поэтому в ETag входят куки
+    запроса — так же, как в ключ cache_page с Vary: Cookie. ETag слабый:
+    токен CSRF в формах меняется при каждой отрисовке.
+    """
+    cookies = request.META.get('HTTP_COOKIE', '')
+    digest = hashlib.md5(f'{versions}|{cookies}'.encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def respond_conditionally(
+    request: HttpRequest,
+    etag: str,
+    view: Callable,
+    **kwargs,
+) -> HttpResponse:
+    """Отвечает 304 Not Modified, если у клиента страница с тем же ETag.
+
+    Иначе вызывает представление. Браузеру и прокси разрешено хранить
+    страницу, но перед показом её нужно перепроверить.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = view(request, **kwargs)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True, max_age=0)
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def revalidate(
+    scopes: Callable[..., Iterable[str]],
+    state: Optional[Callable[..., str]] = None,
+) -> Callable:
+    """Отвечает 304, пока не сменилось поколение областей страницы.
+
+    Args:
+        scopes (Callable): функция от запроса и аргументов представления,
+            возвращающая области, от которых зависит страница.
+        state (Callable): функция с теми же аргументами, возвращающая
+            значения на странице, у которых нет своей области.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(request: HttpRequest, **kwargs) -> HttpResponse:
+            if request.method not in SAFE_METHODS:
+                return view(request, **kwargs)
+            versions = current_versions(scopes(request, **kwargs))
+            if state is not None:
+                versions = f'{versions}|{state(request, **kwargs)}'
+            etag = versions_etag(request, versions)
+            return respond_conditionally(request, etag, view, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def cache_listing(
+    *scopes: str,
+    timeout: int = settings.LISTING_CACHE_TIMEOUT,
+) -> Callable:
+    """Кэширует страницу до изменения поколения любой из её областей.
+
+    Области задаются шаблонами вроде 'group:{slug}', которые заполняются
+    аргументами представления. Ответы различаются по Cookie, так что
+    страницы авторизованных пользователей не смешиваются. Пока поколения
+    не сменились, клиенту с тем же ETag отвечает 304 Not Modified, даже не
+    доставая страницу из кэша.
+
+    Args:
+        scopes (str): шаблоны областей, от которых зависит страница.
+        timeout (int): предельное время жизни страницы в кэше.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        varying_view = vary_on_cookie(view)
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, **kwargs) -> HttpResponse:
+            if request.method not in SAFE_METHODS:
+                return view(request, **kwargs)
+            versions = current_versions(
+                scope.format(**kwargs) for scope in scopes
+            )
+            return respond_conditionally(
+                request,
+                versions_etag(request, versions),
+                cache_page(
+                    timeout,
+                    key_prefix=f'{view.__name__}:{versions}',
+                )(varying_view),
+                **kwargs,
+            )
+
+        return wrapper
+
+    return decorator
+
+
+# Отметка в кэше объектов: записи с таким ключом нет в базе.
+MISSING = 'missing'
+
+
+def object_key(model: Type[Model], field: str, value: object) -> str:
+    return f'object:{model._meta.label_lower}:{field}:{value}'
+
+
+def model_scope(model: Type[Model]) -> str:
+    """Область, поколение которой меняется при любой записи модели."""
+    return f'object:{model._meta.label_lower}'
+
+
+def fetch_object(
+    model: Type[Model],
+    field: str,
+    value: object,
+    related: Iterable[str] = (),
+    queryset: Optional[QuerySet] = None,
+) -> Optional[Model]:
+    """Читает запись из базы и кладёт её в кэш объектов.
+
+    Запись хранится вместе с поколением ключа, прочитанным до запроса
+    к базе: если запись успели изменить, forget_object сменит поколение,
+    и положенная сюда старая версия уже не совпадёт с ним. Ключи pk и
+    связанных объектов до запроса неизвестны, поэтому они кладутся в кэш,
+    только если поколение их моделей за время запроса не менялось.
+    Аннотации `queryset` зависят от запроса и в кэш не попадают.
+    """
+    if queryset is None:
+        queryset = model._default_manager.all()
+    timeout = settings.OBJECT_CACHE_TIMEOUT
+    key = object_key(model, field, value)
+    related_fields = [model._meta.get_field(name) for name in related]
+    scopes = {model_scope(model)} | {
+        model_scope(descriptor.related_model) for descriptor in related_fields
+    }
+    before = versions_of([key, *scopes], timeout)
+    try:
+        instance = queryset.select_related(*related).get(**{field: value})
+    except model.DoesNotExist:
+        cache.set(
+            key,
+            (before[key], MISSING),
+            settings.OBJECT_CACHE_MISS_TIMEOUT,
+        )
+        return None
+    instances = {object_key(model, 'pk', instance.pk): instance}
+    for descriptor in related_fields:
+        related_instance = descriptor.get_cached_value(instance, None)
+        if related_instance is not None:
+            instances[
+                object_key(type(related_instance), 'pk', related_instance.pk)
+            ] = related_instance
+        # Связанная запись меняется отдельно и хранится под своим ключом.
+        descriptor.delete_cached_value(instance)
+    cached = {}
+    if field == 'pk':
+        cached[key] = (before[key], instances.pop(key))
+    else:
+        cached[key] = (before[key], instance.pk)
+    if instances:
+        after = versions_of([*scopes, *instances], timeout)
+        if all(after[scope] == before[scope] for scope in scopes):
+            for instance_key, cached_instance in instances.items():
+                cached[instance_key] = (after[instance_key], cached_instance)
+    annotations = {
+        name: instance.__dict__.pop(name)
+        for name in queryset.query.annotations
+    }
+    cache.set_many(cached, timeout)
+    instance.__dict__.update(annotations)
+    return instance
+
+
+def cached_object(
+    model: Type[Model],
+    related: Iterable[str] = (),
+    queryset: Optional[QuerySet] = None,
+    **lookup: object,
+) -> Optional[Model]:
+    """Читает запись модели через кэш; None, если её нет.
+
+    Запись хранится под ключом первичного ключа, а по другим полям
+    (slug, username) в кэше лежит только её pk. Отсутствие записи тоже
+    кэшируется, на settings.OBJECT_CACHE_MISS_TIMEOUT. Связанные объекты
+    хранятся под своими ключами: при промахе записи из `related`
+    выбираются тем же запросом через select_related и кладутся в кэш
+    отдельно, откуда их затем берёт вызывающий.
+
+    Args:
+        model (Type[Model]): модель.
+        related (Iterable[str]): связи «один к одному» и внешние ключи
+            для заполнения кэша при промахе.
+        queryset (Optional[QuerySet]): запрос для промаха, например
+            с аннотациями для вызывающего; из кэша они не возвращаются.
+        lookup: одно условие точного совпадения, например `slug=...`.
+    """
+    (field, value), = lookup.items()
+    key = object_key(model, field, value)
+    found = cache.get_many([key, version_key(key)])
+    version = found.get(version_key(key))
+    if key not in found or version is None or found[key][0] != version:
+        return fetch_object(model, field, value, related, queryset)
+    cached = found[key][1]
+    if cached == MISSING:
+        return None
+    if field == 'pk':
+        return cached
+    instance = cached_object(model, related, queryset, pk=cached)
+    # После переименования по старому ключу найдётся запись с новым.
+    if instance is None or getattr(instance, field) != value:
+        return fetch_object(model, field, value, related, queryset)
+    return instance
+
+
+def cached_object_or_404(
+    model: Type[Model],
+    related: Iterable[str] = (),
+    queryset: Optional[QuerySet] = None,
+    **lookup: object,
+) -> Model:
+    instance = cached_object(model, related, queryset, **lookup)
+    if instance is None:
+        raise Http404(f'{model._meta.object_name} не найден')
+    return instance
+
+
+def forget_object(model: Type[Model], pk: object, **fields: object) -> None:
+    """Делает недоступными в кэше запись и ключи по её полям `fields`.
+
+    Поколения ключей меняются сразу и ещё раз после фиксации транзакции:
+    запрос, прочитавший старую версию записи до фиксации, положит её
+    в кэш со старым поколением, и она не будет прочитана.
+    """
+    scopes = [model_scope(model), object_key(model, 'pk', pk)] + [
+        object_key(model, field, value) for field, value in fields.items()
+    ]
+    timeout = settings.OBJECT_CACHE_TIMEOUT
+    bump_versions(scopes, timeout)
+    transaction.on_commit(lambda: bump_versions(scopes, timeout))
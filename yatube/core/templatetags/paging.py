@@ -0,0 +1,19 @@
+from typing import List, Union
+
+from django import template
+from django.core.paginator import Page
+
+from core.utils import ELLIPSIS, elided_page_range
+
+register = template.Library()
+
+
+@register.filter
+def elided_range(page: Page) -> List[Union[int, str]]:
+    return elided_page_range(page)
+
+
+@register.filter
+def is_gap(page: Union[int, str]) -> bool:
+    """Пропуск страниц в выводе elided_range, а не номер страницы."""
+    return page == ELLIPSIS
@@ -1,8 +1,36 @@
+import shutil
+import tempfile
 from http import HTTPStatus
+from pathlib import Path
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
 from faker import Faker
+from mixer.backend.django import mixer
 
+from core.caching import (
+    cached_object,
+    cached_object_or_404,
+    forget_object,
+    object_key,
+)
+from core.utils import (
+    ELLIPSIS,
+    FEED_ORDERING,
+    elided_page_range,
+    feed_count_key,
+    paginate,
+)
+from posts.models import Group, Post, UserCounters
+
+User = get_user_model()
 fake = Faker()
 
 
@@ -11,3 +39,295 @@ class ViewTestClass(TestCase):
         response = self.client.get(fake.pystr(min_chars=3, max_chars=13))
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.posts = mixer.cycle(13).blend('posts.Post')
+        cls.factory = RequestFactory()
+
+    def get_page(self, **params):
+        return paginate(
+            self.factory.get('/', params),
+            Post.objects.all(),
+            5,
+            cursor=True,
+        )
+
+    def test_cursor_pages_cover_feed_without_gaps(self):
+        seen = []
+        page = self.get_page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            page = self.get_page(after=page.next_cursor)
+        self.assertEqual(
+            seen,
+            list(
+                Post.objects.order_by(*FEED_ORDERING).values_list(
+                    'pk',
+                    flat=True,
+                ),
+            ),
+        )
+
+    def test_cursor_page_is_stable_under_inserts(self):
+        first = self.get_page()
+        second = self.get_page(after=first.next_cursor)
+        mixer.blend('posts.Post')
+        self.assertEqual(
+            list(self.get_page(after=first.next_cursor)),
+            list(second),
+        )
+
+    def test_before_cursor_returns_previous_page(self):
+        first = self.get_page()
+        second = self.get_page(after=first.next_cursor)
+        back = self.get_page(before=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        self.assertEqual(
+            list(self.get_page(after=fake.pystr())),
+            list(self.get_page()),
+        )
+
+
+class CountCachePaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.posts = mixer.cycle(13).blend('posts.Post')
+        cls.factory = RequestFactory()
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, page):
+        return paginate(
+            self.factory.get('/', {'page': page}),
+            Post.objects.all(),
+            5,
+            cursor=False,
+            scope='test',
+        )
+
+    def test_warm_counter_page_takes_one_query(self):
+        cache.set(feed_count_key('test'), 13)
+        with self.assertNumQueries(1):
+            page = self.get_page(2)
+            self.assertEqual(page.paginator.num_pages, 3)
+            self.assertTrue(page.has_next())
+
+    def test_cold_counter_is_counted_once(self):
+        with self.assertNumQueries(2):
+            page = self.get_page(1)
+            self.assertEqual(len(page), 5)
+            self.assertEqual(page.paginator.num_pages, 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_page(2).paginator.num_pages, 3)
+
+    def test_next_page_corrects_low_counter(self):
+        cache.set(feed_count_key('test'), 4)
+        page = self.get_page(1)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertIsNone(cache.get(feed_count_key('test')))
+
+    def test_last_page_corrects_stale_counter(self):
+        cache.set(feed_count_key('test'), 40)
+        page = self.get_page(3)
+        self.assertFalse(page.has_next())
+        self.assertEqual(cache.get(feed_count_key('test')), 13)
+
+    def test_out_of_range_page_returns_last_page(self):
+        cache.set(feed_count_key('test'), 40)
+        self.assertEqual(self.get_page(8).number, 3)
+
+
+class ElidedPageRangeTest(TestCase):
+    def get_range(self, number, num_pages):
+        paginator = Paginator(range(num_pages), 1)
+        return elided_page_range(paginator.page(number))
+
+    def test_short_range_is_not_elided(self):
+        self.assertEqual(self.get_range(3, 7), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_long_range_is_elided_around_current_page(self):
+        self.assertEqual(
+            self.get_range(50, 100_000),
+            [1, ELLIPSIS, 48, 49, 50, 51, 52, ELLIPSIS, 100_000],
+        )
+
+    def test_gaps_are_rendered_without_links(self):
+        html = render_to_string(
+            'includes/paginator.html',
+            {'page_obj': Paginator(range(100), 1).page(50)},
+        )
+        self.assertEqual(html.count('<span class="page-link">…</span>'), 2)
+        self.assertNotIn('?page=…', html)
+
+    def test_range_near_edges(self):
+        self.assertEqual(
+            self.get_range(1, 100),
+            [1, 2, 3, ELLIPSIS, 100],
+        )
+        self.assertEqual(
+            self.get_range(100, 100),
+            [1, ELLIPSIS, 98, 99, 100],
+        )
+
+
+class ObjectCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = mixer.blend('posts.Group', slug='cached')
+
+    def test_lookup_reads_through_cache(self):
+        cached_object(Group, slug='cached')
+        with self.assertNumQueries(0):
+            by_slug = cached_object(Group, slug='cached')
+            by_pk = cached_object(Group, pk=self.group.pk)
+        self.assertEqual(by_slug, self.group)
+        self.assertEqual(by_pk, self.group)
+
+    def test_missing_object_is_cached(self):
+        with self.assertRaises(Http404):
+            cached_object_or_404(Group, slug='new')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            cached_object_or_404(Group, slug='new')
+        group = mixer.blend('posts.Group', slug='new')
+        self.assertEqual(cached_object(Group, slug='new'), group)
+
+    def test_save_and_rename_invalidate_cache(self):
+        cached_object(Group, slug='cached')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertEqual(
+            cached_object(Group, slug='cached').title,
+            'Новое название',
+        )
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertIsNone(cached_object(Group, slug='cached'))
+        self.assertEqual(cached_object(Group, slug='renamed'), self.group)
+
+    def test_read_racing_forget_does_not_cache_old_row(self):
+        get = QuerySet.get
+
+        def get_then_rename(queryset, *args, **kwargs):
+            instance = get(queryset, *args, **kwargs)
+            # Запись меняют, пока прочитанная версия ещё не в кэше.
+            Group.objects.filter(pk=instance.pk).update(title='Новое')
+            forget_object(Group, instance.pk, slug=instance.slug)
+            return instance
+
+        with mock.patch.object(QuerySet, 'get', get_then_rename):
+            cached_object(Group, slug='cached')
+        self.assertEqual(cached_object(Group, slug='cached').title, 'Новое')
+        self.assertEqual(
+            cached_object(Group, pk=self.group.pk).title,
+            'Новое',
+        )
+
+    def test_related_objects_are_cached_separately(self):
+        post = mixer.blend('posts.Post', group=self.group, image='')
+        cached = cached_object(Post, related=('author', 'group'), pk=post.pk)
+        self.assertNotIn('author', cached._state.fields_cache)
+        with self.assertNumQueries(0):
+            cached_object(Group, pk=self.group.pk)
+            author = cached_object(User, pk=post.author_id)
+        cache.delete(object_key(User, 'pk', author.pk))
+        cached_object(User, related=('counters',), pk=author.pk)
+        with self.assertNumQueries(0):
+            counters = cached_object(UserCounters, pk=author.pk)
+        self.assertEqual(counters.posts_count, 1)
+        mixer.blend('posts.Post', author=post.author, image='')
+        self.assertEqual(
+            cached_object(UserCounters, pk=post.author_id).posts_count,
+            2,
+        )
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SENDFILE='X-Sendfile')
+class MediaServingTest(TestCase):
+    content = bytes(range(256)) * 4
+    addressed = 'posts/ab/cd/abcd' + '0' * 60 + '.jpg'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('posts/legacy.png', cls.addressed, '.incoming/tmp'):
+            path = Path(MEDIA_ROOT, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(cls.content)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def test_file_is_served_with_validators(self):
+        response = self.get('posts/legacy.png')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age=86400', response['Cache-Control'])
+
+    def test_addressed_file_is_immutable(self):
+        response = self.get(self.addressed)
+        self.assertEqual(response['ETag'], '"abcd%s"' % ('0' * 60))
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get('posts/legacy.png')['ETag']
+        response = self.get('posts/legacy.png', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    @override_settings(
+        MEDIA_SENDFILE='X-Accel-Redirect',
+        MEDIA_SENDFILE_PREFIX='/protected/',
+    )
+    def test_transfer_is_offloaded_to_nginx(self):
+        response = self.get(self.addressed)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            f'/protected/{self.addressed}',
+        )
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_transfer_is_offloaded_by_path(self):
+        response = self.get('posts/legacy.png')
+        self.assertEqual(
+            response['X-Sendfile'],
+            str(Path(MEDIA_ROOT, 'posts/legacy.png')),
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_SENDFILE='')
+    def test_transfer_requires_web_server(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.get('posts/legacy.png')
+
+    def test_hidden_and_outside_paths_are_not_served(self):
+        for name in ('.incoming/tmp', 'posts/../../etc/passwd', 'posts'):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.get(name).status_code,
+                    HTTPStatus.NOT_FOUND,
+                )
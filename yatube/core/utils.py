@@ -1,15 +1,312 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+
 from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Page, Paginator
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 from django.http import HttpRequest
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+FEED_ORDERING = ('-pub_date', '-pk')
+
+OLDEST_FIRST_ORDERING = ('pub_date', 'pk')
+
+ELLIPSIS = '…'
+
+
+def feed_count_key(scope: str) -> str:
+    """Ключ кэша со счётчиком записей ленты, например `group:3`."""
+    return f'feed_count:{scope}'
+
+
+def encode_cursor(pub_date: datetime, pk: int) -> str:
+    """Упаковывает позицию записи в ленте в непрозрачный токен."""
+    raw = f'{pub_date.isoformat()},{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Распаковывает токен курсора.
+
+    Returns:
+        Пару (pub_date, pk) или None, если токен пуст или повреждён.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().rsplit(',', 1)
+        parsed = parse_datetime(pub_date)
+        if parsed is None:
+            return None
+        return parsed, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_seek(
+    queryset: QuerySet,
+    key: Tuple[datetime, int],
+    newer: bool,
+    pk_field: str = 'pk',
+    ascending: bool = False,
+) -> QuerySet:
+    """Оставляет записи ленты старше или новее позиции `key`.
+
+    Записи, которые в порядке ленты идут до позиции (новее неё, а при
+    `ascending` — старше), возвращаются в обратном порядке, от ближайшей
+    к `key`, чтобы их можно было выбрать срезом.
+    """
+    pub_date, pk = key
+    if newer:
+        queryset = queryset.filter(
+            Q(pub_date__gt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk_field}__gt': pk}),
+        )
+    else:
+        queryset = queryset.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk_field}__lt': pk}),
+        )
+    return queryset.reverse() if newer != ascending else queryset
+
+
+class CursorPage(Page):
+    """Страница ленты, построенная по курсору, а не по номеру.
+
+    Не знает общего числа записей: наличие соседних страниц определяется
+    по лишней выбранной строке и по направлению перехода. Токены соседних
+    страниц вычисляются сразу, поэтому object_list можно затем заменить.
+    """
+
+    is_cursor = True
+
+    def __init__(
+        self,
+        object_list: list,
+        paginator: 'CursorPaginator',
+        has_next: bool,
+        has_previous: bool,
+    ) -> None:
+        super().__init__(object_list, 1, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = self.previous_cursor = ''
+        if object_list:
+            first, last = object_list[0], object_list[-1]
+            self.previous_cursor = encode_cursor(first.pub_date, first.pk)
+            self.next_cursor = encode_cursor(last.pub_date, last.pk)
+
+    def __repr__(self) -> str:
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, pk) без COUNT(*) и OFFSET.
+
+    Позиция страницы задаётся токеном записи, после (`after`) или до
+    (`before`) которой нужно продолжить вывод, поэтому новые записи,
+    добавленные между запросами, не сдвигают уже открытые страницы.
+    При `ascending` записи упорядочены от старых к новым.
+    """
+
+    def __init__(
+        self,
+        object_list: QuerySet,
+        per_page: int,
+        ascending: bool = False,
+    ) -> None:
+        super().__init__(object_list, per_page)
+        self.ascending = ascending
+
+    def _seek(self, key: Tuple[datetime, int], forward: bool) -> QuerySet:
+        newer = forward == self.ascending
+        if isinstance(self.object_list, QuerySet):
+            return keyset_seek(
+                self.object_list,
+                key,
+                newer,
+                ascending=self.ascending,
+            )
+        return self.object_list.seek(key, newer)
+
+    def get_cursor_page(
+        self,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> CursorPage:
+        after_key = decode_cursor(after)
+        before_key = None if after_key else decode_cursor(before)
+        queryset = self.object_list
+        if after_key:
+            queryset = self._seek(after_key, forward=True)
+        elif before_key:
+            queryset = self._seek(before_key, forward=False)
+        rows = list(queryset[:self.per_page + 1])  # fmt: skip
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]  # fmt: skip
+        if before_key:
+            rows.reverse()
+            return CursorPage(rows, self, bool(rows), has_more)
+        return CursorPage(rows, self, has_more, after_key is not None)
+
+
+class CountCachePaginator(Paginator):
+    """Нумерованная пагинация без COUNT(*) на каждый запрос.
+
+    Число записей берётся из счётчика в кэше, который поддерживают
+    сигналы и команда refresh_feed_counts, а без него — из `count`,
+    если вызывающий уже знает его; если нет и его, выполняется COUNT(*),
+    и результат кладётся в кэш. Страница выбирается одним запросом на
+    PAGE_SIZE+1 строк: лишняя строка показывает, есть ли следующая
+    страница, даже если счётчик устарел.
+    """
+
+    def __init__(
+        self,
+        object_list: QuerySet,
+        per_page: int,
+        scope: str,
+        count: Optional[int] = None,
+    ):
+        super().__init__(object_list, per_page)
+        self.count_key = feed_count_key(scope)
+        self.known_count = count
+
+    @cached_property
+    def count(self) -> int:
+        count = cache.get(self.count_key)
+        if count is None:
+            count = self.known_count
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, settings.FEED_COUNT_TIMEOUT)
+        return count
+
+    def _set_count(self, count: int) -> None:
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+
+    def get_page(self, number: Optional[str]) -> Page:
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        return self.page(number)
+
+    def page(self, number: int) -> Page:
+        bottom = (number - 1) * self.per_page
+        rows = list(
+            self.object_list[bottom:bottom + self.per_page + 1],  # fmt: skip
+        )
+        if not rows and number > 1:
+            self.__dict__.pop('count', None)
+            cache.delete(self.count_key)
+            return super().page(self.num_pages)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]  # fmt: skip
+        seen = bottom + len(rows)
+        if has_next:
+            # Без счётчика записи считаются один раз: по нижней границе
+            # seen + 1 ссылка на последнюю страницу вела бы на следующую.
+            if self.count <= seen:
+                # Счётчик отстал; в следующий раз он будет пересчитан.
+                cache.delete(self.count_key)
+                self._set_count(seen + 1)
+        else:
+            cache.set(self.count_key, seen, settings.FEED_COUNT_TIMEOUT)
+            self._set_count(seen)
+        return self._get_page(rows, number, self)
+
+
+def elided_page_range(
+    page: Page,
+    on_each_side: int = 2,
+    on_ends: int = 1,
+) -> List[Union[int, str]]:
+    """Возвращает номера страниц для навигации с пропусками.
+
+    Вместо всех страниц выводятся первые и последние `on_ends`, по
+    `on_each_side` вокруг текущей и ELLIPSIS на месте пропусков, так что
+    размер навигации не зависит от общего числа страниц.
+    """
+    number = page.number
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(page.paginator.page_range)
+    pages = []
+    if number > on_each_side + on_ends + 2:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(ELLIPSIS)
+        pages.extend(range(number - on_each_side, number + 1))
+    else:
+        pages.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        pages.extend(range(number + 1, number + on_each_side + 1))
+        pages.append(ELLIPSIS)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(number + 1, num_pages + 1))
+    return pages
 
 
 def paginate(
     request: HttpRequest,
     queryset: QuerySet,
     objects_num: int = settings.PAGE_SIZE,
+    cursor: Optional[bool] = None,
+    scope: Optional[str] = None,
+    oldest_first: bool = False,
+    count: Optional[int] = None,
 ) -> Page:
-    return Paginator(
-        queryset.order_by('-pub_date'),
-        objects_num,
-    ).get_page(request.GET.get('page'))
+    """Разбивает ленту записей на страницы.
+
+    Args:
+        request (HttpRequest): запрос с параметрами `page` или
+            `after`/`before`.
+        queryset (QuerySet): записи ленты.
+        objects_num (int): число записей на странице.
+        cursor (bool): включить курсорный режим; по умолчанию режим
+            выбирается по имени представления в
+            settings.CURSOR_PAGINATED_VIEWS.
+        scope (str): имя счётчика записей ленты в кэше; без него
+            число записей считается запросом COUNT(*).
+        oldest_first (bool): выводить записи от старых к новым.
+        count (int): известное заранее число записей, например из
+            счётчика в базе; используется вместе со `scope`.
+
+    Returns:
+        Страницу с номером из `page` либо CursorPage.
+    """
+    if cursor is None:
+        match = request.resolver_match
+        cursor = bool(match) and (
+            match.view_name in settings.CURSOR_PAGINATED_VIEWS
+        )
+    queryset = queryset.order_by(
+        *(OLDEST_FIRST_ORDERING if oldest_first else FEED_ORDERING),
+    )
+    if cursor:
+        return CursorPaginator(
+            queryset,
+            objects_num,
+            ascending=oldest_first,
+        ).get_cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    if scope:
+        paginator = CountCachePaginator(queryset, objects_num, scope, count)
+    else:
+        paginator = Paginator(queryset, objects_num)
+    return paginator.get_page(request.GET.get('page'))
@@ -1,7 +1,25 @@
+import mimetypes
+import os
+import stat
 from http import HTTPStatus
+from urllib.parse import quote
 
-from django.http import HttpRequest, HttpResponse
+from django.conf import settings
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    SuspiciousFileOperation,
+)
+from django.http import Http404, HttpRequest, HttpResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from posts.storage import ContentAddressedStorage
+
+# Имена файлов с адресацией по содержимому не меняют содержимого.
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
 
 
 def page_not_found(
@@ -43,3 +61,75 @@ def csrf_failure(
 ) -> HttpResponse:
     del reason
     return render(request, 'core/403csrf.html')
+
+
+def transfer_file(path: str, full_path: str) -> HttpResponse:
+    """Ответ с указанием веб-серверу отдать файл самому."""
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'X-Accel-Redirect':
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_SENDFILE_PREFIX + path,
+        )
+    else:
+        response[settings.MEDIA_SENDFILE] = full_path
+    content_type, encoding = mimetypes.guess_type(full_path)
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+@require_safe
+def serve_media(request: HttpRequest, path: str) -> HttpResponse:
+    """Отдаёт файл из MEDIA_ROOT.
+
+    Django проверяет путь и отвечает на условные запросы, а сами байты
+    и Range передаёт веб-сервер, указанный в settings.MEDIA_SENDFILE:
+    nginx по X-Accel-Redirect из internal-location с префиксом
+    settings.MEDIA_SENDFILE_PREFIX, Apache и lighttpd — по X-Sendfile.
+    Без настройки view отвечает ошибкой конфигурации: байты файлов не
+    должны идти через процессы Django, а в DEBUG медиа отдаёт static().
+    """
+    if not settings.MEDIA_SENDFILE:
+        raise ImproperlyConfigured(
+            'Для отдачи медиа без DEBUG задайте MEDIA_SENDFILE: '
+            'X-Accel-Redirect или X-Sendfile.',
+        )
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        status = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(status.st_mode):
+        raise Http404
+    immutable = ContentAddressedStorage.is_addressed(path)
+    if immutable:
+        etag = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    else:
+        etag = f'"{status.st_mtime_ns:x}-{status.st_size:x}"'
+    mtime = int(status.st_mtime)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=mtime,
+    )
+    if response is None:
+        response = transfer_file(path, full_path)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    if immutable:
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=IMMUTABLE_MAX_AGE,
+            immutable=True,
+        )
+    else:
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.MEDIA_CACHE_MAX_AGE,
+        )
+    return response
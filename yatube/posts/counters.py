@@ -0,0 +1,131 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Сигналы сдвигают их выражениями F() в той же транзакции, что и саму
+запись, поэтому одновременные изменения не теряются. recount()
+пересчитывает все счётчики несколькими UPDATE с подзапросами — на случай
+изменений в обход сигналов: update(), SET NULL при удалении группы,
+загрузки фикстур.
+"""
+from itertools import islice
+from typing import Dict, Optional
+
+from django.db.models import (
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    QuerySet,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from core.caching import forget_object
+from posts.models import Comment, Follow, Group, Post, User, UserCounters
+
+
+def shift(queryset: QuerySet, **deltas: int) -> int:
+    # Отставший счётчик не уходит ниже нуля: иначе удаление упрётся
+    # в CHECK положительного поля.
+    return queryset.update(
+        **{
+            field: F(field) + delta if delta > 0 else Greatest(
+                F(field) + delta,
+                0,
+            )
+            for field, delta in deltas.items()
+        },
+    )
+
+
+def shift_user(user_id: int, **deltas: int) -> None:
+    shift(UserCounters.objects.filter(user_id=user_id), **deltas)
+    forget_object(UserCounters, user_id)
+
+
+def shift_group(group_id: Optional[int], delta: int) -> None:
+    if group_id:
+        shift(Group.objects.filter(pk=group_id), posts_count=delta)
+        forget_object(Group, group_id)
+
+
+def shift_post(post_id: Optional[int], delta: int) -> None:
+    if post_id:
+        shift(Post.objects.filter(pk=post_id), comments_count=delta)
+        forget_object(Post, post_id)
+
+
+def count_of(queryset: QuerySet, field: str) -> Coalesce:
+    """Подзапрос с числом записей `queryset`, ссылающихся полем `field`
+    на внешнюю запись."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def create_user_counters(batch_size: int = 1000) -> int:
+    """Создаёт недостающие строки UserCounters; возвращает их число."""
+    missing = (
+        User.objects.filter(counters__isnull=True)
+        .values_list('pk', flat=True)
+        .iterator(chunk_size=batch_size)
+    )
+    created = 0
+    while True:
+        batch = [
+            UserCounters(user_id=pk) for pk in islice(missing, batch_size)
+        ]
+        if not batch:
+            return created
+        UserCounters.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+
+
+def user_counts() -> Dict[str, Coalesce]:
+    return {
+        'posts_count': count_of(Post.objects.all(), 'author'),
+        'followers_count': count_of(Follow.objects.all(), 'author'),
+        'following_count': count_of(Follow.objects.all(), 'user'),
+    }
+
+
+def counters_for(user_id: int) -> UserCounters:
+    """Счётчики пользователя; недостающая строка создаётся и считается.
+
+    Строки нет у пользователей, созданных в обход сигнала: loaddata или
+    bulk_create.
+    """
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=user_id)],
+        ignore_conflicts=True,
+    )
+    UserCounters.objects.filter(pk=user_id).update(**user_counts())
+    forget_object(UserCounters, user_id)
+    return UserCounters.objects.get(pk=user_id)
+
+
+def recount() -> Dict[str, int]:
+    """Пересчитывает все счётчики.
+
+    Returns:
+        Число созданных строк UserCounters (`created`) и число
+        пересчитанных строк по таблицам.
+    """
+    return {
+        'created': create_user_counters(),
+        'users': UserCounters.objects.update(**user_counts()),
+        'posts': Post.objects.update(
+            comments_count=count_of(Comment.objects.all(), 'post'),
+        ),
+        'groups': Group.objects.update(
+            posts_count=count_of(Post.objects.all(), 'group'),
+        ),
+    }
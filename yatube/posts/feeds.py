@@ -0,0 +1,366 @@
+"""Движки ленты подписок, выбираемые settings.FOLLOW_FEED_ENGINE.
+
+`timeline` — гибрид fan-out on write и чтения по запросу: посты обычных
+авторов раскладываются по лентам подписчиков при публикации (FeedEntry),
+и чтение `/follow/` сводится к диапазону по индексу (user, pub_date).
+Посты авторов с флагом UserCounters.celebrity не копируются, а
+подмешиваются в ленту при чтении. Автор получает флаг, когда подписчиков
+становится не меньше settings.FEED_CELEBRITY_FOLLOWERS, и теряет, когда
+их меньше settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS; разрыв между порогами
+не даёт автору у границы переключаться с каждой подпиской. Подписка лишь
+отмечает пересечение порога в журнале, а ленты перестраивает команда
+`feed_split --rebalance`.
+
+`merge` — лента собирается при чтении слиянием кучей отдельных потоков
+постов каждого автора, головы которых хранятся в кэше.
+"""
+import heapq
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from core.caching import forget_object
+from core.utils import FEED_ORDERING, keyset_seek
+from posts.models import (
+    FeedEntry,
+    Follow,
+    Post,
+    PostQuerySet,
+    User,
+    UserCounters,
+)
+
+logger = logging.getLogger(__name__)
+
+FeedKey = Tuple[datetime, int]
+
+
+class FeedStream(NamedTuple):
+    """Упорядоченный по убыванию (pub_date, pk поста) источник ленты."""
+
+    queryset: QuerySet
+    entries: bool = False
+
+    @property
+    def pk_field(self) -> str:
+        return 'post_id' if self.entries else 'pk'
+
+    def posts(self, stop: int) -> Iterable[Post]:
+        rows = self.queryset[:stop]  # fmt: skip
+        if self.entries:
+            return (entry.post for entry in rows)
+        return iter(rows)
+
+
+class MergedFeed:
+    """Лента, собранная слиянием нескольких FeedStream.
+
+    Поддерживает срезы, count() и seek(), поэтому передаётся в paginate()
+    вместо QuerySet: каждая страница читает из источников не больше
+    строк, чем нужно до её конца.
+    """
+
+    ordered = True
+
+    def __init__(self, streams: List[FeedStream], newest_first: bool = True):
+        self.streams = streams
+        self.newest_first = newest_first
+
+    def order_by(self, *fields: str) -> 'MergedFeed':
+        return self
+
+    def count(self) -> int:
+        return sum(stream.queryset.count() for stream in self.streams)
+
+    def seek(self, key: FeedKey, newer: bool) -> 'MergedFeed':
+        return MergedFeed(
+            [
+                stream._replace(
+                    queryset=keyset_seek(
+                        stream.queryset,
+                        key,
+                        newer,
+                        stream.pk_field,
+                    ),
+                )
+                for stream in self.streams
+            ],
+            newest_first=not newer,
+        )
+
+    def __getitem__(self, item: slice) -> List[Post]:
+        posts = heapq.merge(
+            *(stream.posts(item.stop) for stream in self.streams),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=self.newest_first,
+        )
+        return list(islice(posts, item.start, item.stop))
+
+
+def author_stream_key(author_id: int) -> str:
+    return f'author_stream:{author_id}'
+
+
+def author_posts(author_id: int) -> QuerySet:
+    return Post.objects.filter(author=author_id).order_by(*FEED_ORDERING)
+
+
+def author_heads(author_ids: List[int]) -> Dict[int, List[FeedKey]]:
+    """Возвращает из кэша последние посты авторов как (pub_date, pk)."""
+    keys = {author_stream_key(pk): pk for pk in author_ids}
+    heads = {keys[key]: head for key, head in cache.get_many(keys).items()}
+    missing = {}
+    for key, author_id in keys.items():
+        if author_id not in heads:
+            rows = author_posts(author_id).values_list('pub_date', 'pk')
+            heads[author_id] = missing[key] = list(
+                rows[:settings.FEED_STREAM_SIZE],  # fmt: skip
+            )
+    cache.set_many(missing, settings.FEED_STREAM_TIMEOUT)
+    return heads
+
+
+class AuthorMergeFeed:
+    """Лента, собранная слиянием потоков постов отдельных авторов.
+
+    Каждый поток — это голова из кэша, а если её не хватает до конца
+    страницы, диапазон по индексу (author, pub_date). Потоки сливаются
+    кучей до границы среза, затем посты выбираются одним запросом.
+    Протокол тот же, что у MergedFeed.
+    """
+
+    ordered = True
+
+    def __init__(
+        self,
+        author_ids: List[int],
+        key: Optional[FeedKey] = None,
+        newer: bool = False,
+    ):
+        self.author_ids = author_ids
+        self.key = key
+        self.newer = newer
+
+    def order_by(self, *fields: str) -> 'AuthorMergeFeed':
+        return self
+
+    def count(self) -> int:
+        return Post.objects.filter(author__in=self.author_ids).count()
+
+    def seek(self, key: FeedKey, newer: bool) -> 'AuthorMergeFeed':
+        return AuthorMergeFeed(self.author_ids, key, newer)
+
+    def _stream(
+        self,
+        author_id: int,
+        head: List[FeedKey],
+        stop: int,
+    ) -> List[FeedKey]:
+        if self.key is None:
+            window = head
+        elif self.newer:
+            window = [item for item in reversed(head) if item > self.key]
+        else:
+            window = [item for item in head if item < self.key]
+        complete = len(head) < settings.FEED_STREAM_SIZE or (
+            head[-1] <= self.key if self.newer else len(window) >= stop
+        )
+        if complete:
+            return window[:stop]  # fmt: skip
+        queryset = author_posts(author_id)
+        if self.key is not None:
+            queryset = keyset_seek(queryset, self.key, self.newer)
+        return list(queryset.values_list('pub_date', 'pk')[:stop])  # fmt: skip
+
+    def __getitem__(self, item: slice) -> List[Post]:
+        heads = author_heads(self.author_ids)
+        keys = islice(
+            heapq.merge(
+                *(
+                    self._stream(author_id, head, item.stop)
+                    for author_id, head in heads.items()
+                ),
+                reverse=not self.newer,
+            ),
+            item.start,
+            item.stop,
+        )
+        pks = [pk for _, pk in keys]
+        posts = Post.objects.for_feed().in_bulk(pks)
+        return [posts[pk] for pk in pks if pk in posts]
+
+
+def _insert(entries: Iterable[FeedEntry]) -> None:
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def follower_count(author_id: int) -> int:
+    return Follow.objects.filter(author=author_id).count()
+
+
+def is_celebrity(author_id: int) -> bool:
+    return UserCounters.objects.filter(pk=author_id, celebrity=True).exists()
+
+
+def should_switch(celebrity: bool, followers: int) -> bool:
+    if celebrity:
+        return followers < settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS
+    return followers >= settings.FEED_CELEBRITY_FOLLOWERS
+
+
+def note_crossing(author_id: int) -> None:
+    """Отмечает в журнале, что автору пора сменить способ доставки."""
+    celebrity = is_celebrity(author_id)
+    followers = follower_count(author_id)
+    if should_switch(celebrity, followers):
+        logger.info(
+            'Автор %s с %s подписчиками ждёт перестройки лент (%s)',
+            author_id,
+            followers,
+            'раздача' if celebrity else 'подмешивание',
+        )
+
+
+def pending_switches() -> QuerySet:
+    """Счётчики авторов, чей способ доставки расходится с порогами."""
+    return UserCounters.objects.filter(
+        Q(
+            celebrity=False,
+            followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+        )
+        | Q(
+            celebrity=True,
+            followers_count__lt=settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS,
+        ),
+    )
+
+
+def set_celebrity(author_id: int, celebrity: bool) -> None:
+    UserCounters.objects.filter(pk=author_id).update(celebrity=celebrity)
+    forget_object(UserCounters, author_id)
+
+
+def promote(author_id: int) -> None:
+    """Переводит автора на подмешивание при чтении.
+
+    Флаг ставится до чистки лент: с ним чтение уже не берёт его записи
+    из FeedEntry, а новые посты не раздаются.
+    """
+    set_celebrity(author_id, True)
+    pull_author(author_id)
+
+
+def demote(author_id: int) -> None:
+    """Переводит автора на раздачу в ленты.
+
+    Пока посты раскладываются, чтение ещё подмешивает их; опубликованные
+    за это время раскладываются вторым, коротким проходом.
+    """
+    started = timezone.now()
+    push_author(author_id)
+    set_celebrity(author_id, False)
+    push_author(author_id, since=started)
+
+
+def celebrities_followed_by(user: User) -> QuerySet:
+    return Follow.objects.filter(
+        user=user,
+        author__counters__celebrity=True,
+    ).values_list('author', flat=True)
+
+
+def fan_out(post: Post) -> None:
+    """Добавляет новый пост в ленты подписчиков обычного автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(author=post.author_id).values_list(
+        'user',
+        flat=True,
+    )
+    _insert(
+        FeedEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(follow: Follow, since: Optional[datetime] = None) -> None:
+    """Переносит посты автора, начиная с `since`, в ленту подписчика."""
+    posts = Post.objects.filter(author=follow.author_id)
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+    posts = posts.values_list('pk', 'pub_date')
+    _insert(
+        FeedEntry(
+            user_id=follow.user_id,
+            post_id=pk,
+            author_id=follow.author_id,
+            pub_date=pub_date,
+        )
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def purge(follow: Follow) -> None:
+    """Убирает посты автора из ленты отписавшегося читателя."""
+    FeedEntry.objects.filter(
+        user=follow.user_id,
+        author=follow.author_id,
+    ).delete()
+
+
+def push_author(author_id: int, since: Optional[datetime] = None) -> None:
+    """Раскладывает посты автора по лентам его подписчиков."""
+    for follow in Follow.objects.filter(author=author_id).iterator():
+        backfill(follow, since)
+
+
+def pull_author(author_id: int) -> None:
+    """Убирает посты автора из всех лент: их подмешивают при чтении."""
+    FeedEntry.objects.filter(author=author_id).delete()
+
+
+def follow_feed(user: User) -> MergedFeed:
+    if settings.FOLLOW_FEED_ENGINE == 'merge':
+        return AuthorMergeFeed(
+            list(
+                Follow.objects.filter(user=user).values_list(
+                    'author',
+                    flat=True,
+                ),
+            ),
+        )
+    celebrities = list(celebrities_followed_by(user))
+    pushed = (
+        FeedEntry.objects.filter(user=user)
+        .exclude(author__in=celebrities)
+        .select_related('post__author', 'post__group')
+        .only(
+            'pub_date',
+            *(f'post__{field}' for field in PostQuerySet.card_fields),
+        )
+        .order_by('-pub_date', '-post')
+    )
+    streams = [FeedStream(pushed, entries=True)]
+    if celebrities:
+        pulled = (
+            Post.objects.filter(author__in=celebrities)
+            .for_feed()
+            .order_by(*FEED_ORDERING)
+        )
+        streams.append(FeedStream(pulled))
+    return MergedFeed(streams)
@@ -1,5 +1,13 @@
+from typing import Optional
+
 from django import forms
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
 
+from posts import images
 from posts.models import Comment, Post
 
 
@@ -13,6 +21,66 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение',
         }
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Поле остаётся обычным ImageField, меняется только разбор загрузки.
+        self.fields['image'].to_python = self.sniff_image
+
+    def sniff_image(self, data: Optional[UploadedFile]) -> Optional[File]:
+        """Проверяет загрузку по заголовку, не декодируя картинку.
+
+        Слишком большой файл отклоняется до чтения, а размеры в пикселях —
+        до декодирования.
+        """
+        field = self.fields['image']
+        upload = forms.FileField.to_python(field, data)
+        if upload is None:
+            return None
+        if upload.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                'Размер файла не должен превышать %s.'
+                % filesizeformat(settings.IMAGE_MAX_UPLOAD_SIZE),
+                code='file_too_large',
+            )
+        try:
+            image = images.sniff(upload)
+        except (
+            OSError,
+            SyntaxError,
+            ValueError,
+            Image.DecompressionBombError,
+        ):
+            raise forms.ValidationError(
+                field.error_messages['invalid_image'],
+                code='invalid_image',
+            )
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise forms.ValidationError(
+                'Изображение слишком большое: %(width)s×%(height)s.'
+                % {'width': width, 'height': height},
+                code='too_many_pixels',
+            )
+        upload.image = image
+        upload.content_type = Image.MIME.get(image.format)
+        upload.seek(0)
+        return upload
+
+    def save(self, commit: bool = True) -> Post:
+        """Запоминает размеры новой картинки из её заголовка.
+
+        Заглушку и точные размеры после поворота по EXIF потом записывает
+        thumbnails.ingest().
+        """
+        if 'image' in self.changed_data:
+            image = self.cleaned_data.get('image')
+            post = self.instance
+            post.image_width = post.image_height = None
+            post.image_placeholder = ''
+            if isinstance(image, UploadedFile):
+                post.image_width, post.image_height = image.image.size
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,129 @@
+"""Пережатие загруженных картинок постов.
+
+Оригинал сохраняется как есть, а затем в фоне перекодируется в
+settings.IMAGE_FORMAT: картинка уменьшается до settings.IMAGE_MAX_SIDE по
+большей стороне, разворачивается по EXIF и сохраняется без метаданных.
+Заодно запоминаются её размеры и крошечная заглушка для карточки.
+
+При загрузке картинка не декодируется: формат и размеры читаются из
+заголовка, а битые данные всплывут уже при пережатии.
+"""
+import base64
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import IO, NamedTuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from posts.storage import image_storage
+
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+# Форматы, которые принимает форма поста.
+UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP', 'BMP')
+
+EXIF_ORIENTATION = 0x0112
+
+# Значения ориентации, при которых картинка повёрнута на 90°.
+ROTATED = {5, 6, 7, 8}
+
+
+def output_format() -> str:
+    """Формат пережатых картинок; без кодека WebP в Pillow — JPEG."""
+    if settings.IMAGE_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.IMAGE_FORMAT
+
+
+def sniff(file: IO[bytes]) -> Image.Image:
+    """Открывает картинку, прочитав только заголовок.
+
+    Pillow декодирует данные лениво, поэтому формат и размеры известны
+    без чтения всего файла; verify(), как в forms.ImageField, не
+    вызывается — он прошёл бы по всем данным.
+    """
+    return Image.open(file, formats=UPLOAD_FORMATS)
+
+
+def prepare(source: Image.Image, format_: str) -> Image.Image:
+    """Уменьшает и разворачивает картинку перед сохранением в `format_`."""
+    max_side = settings.IMAGE_MAX_SIDE
+    if source.format == 'JPEG':
+        # Декодер JPEG умеет сразу читать картинку в 2–8 раз меньше.
+        source.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(source)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    keep_alpha = has_alpha and format_ != 'JPEG'
+    return image.convert('RGBA' if keep_alpha else 'RGB')
+
+
+def serialize(image: Image.Image, format_: str) -> bytes:
+    buffer = BytesIO()
+    options = {'quality': settings.IMAGE_QUALITY}
+    if format_ == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    else:
+        options['method'] = 4
+    image.save(buffer, format_, **options)
+    return buffer.getvalue()
+
+
+def encode(source: Image.Image, format_: str) -> bytes:
+    return serialize(prepare(source, format_), format_)
+
+
+def placeholder(image: Image.Image) -> str:
+    """Крошечная копия картинки в data URI для фона, пока грузится она."""
+    side = settings.IMAGE_PLACEHOLDER_SIZE
+    if image.format == 'JPEG':
+        image.draft('RGB', (side, side))
+    small = ImageOps.exif_transpose(image).convert('RGB')
+    small.thumbnail((side, side))
+    buffer = BytesIO()
+    small.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue(),
+    ).decode()
+
+
+class ProcessedImage(NamedTuple):
+    name: str
+    width: int
+    height: int
+    placeholder: str
+
+
+def describe(name: str) -> ProcessedImage:
+    """Размеры и заглушка уже сохранённой картинки."""
+    with image_storage.open(name) as file, Image.open(file) as source:
+        width, height = source.size
+        if source.getexif().get(EXIF_ORIENTATION) in ROTATED:
+            width, height = height, width
+        return ProcessedImage(name, width, height, placeholder(source))
+
+
+def recompress(name: str) -> ProcessedImage:
+    """Сохраняет пережатую копию картинки рядом с оригиналом.
+
+    Анимации остаются как есть: для них возвращается исходное имя.
+    """
+    format_ = output_format()
+    with image_storage.open(name) as file, Image.open(file) as source:
+        if getattr(source, 'is_animated', False):
+            return ProcessedImage(name, *source.size, placeholder(source))
+        image = prepare(source, format_)
+        content = serialize(image, format_)
+    path = PurePosixPath(name)
+    return ProcessedImage(
+        image_storage.save(
+            str(path.with_suffix(EXTENSIONS[format_])),
+            ContentFile(content),
+        ),
+        *image.size,
+        placeholder(image),
+    )
@@ -0,0 +1,92 @@
+"""Хранилища ключей и значений sorl-thumbnail."""
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import dbm_kvstore
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+
+class BatchedKVStoreMixin(ABC):
+    """Чтение нескольких ключей разом для хранилищ с _get_many_raw()."""
+
+    def get_many(
+        self,
+        image_files: Iterable[ImageFile],
+    ) -> Dict[str, Optional[ImageFile]]:
+        """Возвращает файлы из хранилища по их ключам sorl."""
+        keys = {
+            add_prefix(image_file.key): image_file.key
+            for image_file in image_files
+        }
+        values = self._get_many_raw(list(keys))
+        return {
+            key: deserialize_image_file(values[raw]) if values[raw] else None
+            for raw, key in keys.items()
+        }
+
+    @abstractmethod
+    def _get_many_raw(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Сырые значения ключей; None для отсутствующих."""
+
+
+class CachedDBMKVStore(BatchedKVStoreMixin, dbm_kvstore.KVStore):
+    """Кэш поверх файла dbm вместо таблицы thumbnail_kvstore.
+
+    Чтение идёт из кэша settings.THUMBNAIL_CACHE, промахи дочитываются из
+    файла settings.THUMBNAIL_DBM_FILE, который переживает сброс кэша и
+    перезапуск. Запись идёт в оба места и не занимает базу. Промахи не
+    кэшируются: миниатюры создаются в других процессах, и кэш этого
+    процесса о них не узнает.
+    """
+
+    def __init__(self):
+        KVStoreBase.__init__(self)
+
+    @property
+    def filename(self) -> str:
+        return str(settings.THUMBNAIL_DBM_FILE)
+
+    @property
+    def mode(self) -> int:
+        return settings.THUMBNAIL_DBM_MODE
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[settings.THUMBNAIL_CACHE]
+
+    def _get_raw(self, key: str) -> Optional[str]:
+        value = self.cache.get(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is None:
+                return None
+            value = value.decode()
+            self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+        return value
+
+    def _get_many_raw(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            fetched = {}
+            with dbm_kvstore.DBMContext(self.filename, self.mode, True) as db:
+                for key in missing:
+                    try:
+                        fetched[key] = db[self._cast_key(key)].decode()
+                    except KeyError:
+                        continue
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        return {key: values.get(key) for key in keys}
+
+    def _set_raw(self, key: str, value: str) -> None:
+        super()._set_raw(key, value)
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+
+    def _delete_raw(self, *keys: str) -> None:
+        super()._delete_raw(*keys)
+        self.cache.delete_many(keys)
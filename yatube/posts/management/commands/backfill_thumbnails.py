@@ -0,0 +1,158 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from core.caching import bump_versions, forget_object
+from posts import images, thumbnails
+from posts.models import Post
+from posts.signals import listing_scopes
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересоздаёт миниатюры картинок всех постов в пуле процессов и '
+        'заполняет размеры и заглушки картинок, где их нет. Прогресс '
+        'сохраняется после каждой пачки, и прерванный запуск продолжается '
+        'с места остановки.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Число процессов; 0 — без пула.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Число постов между сохранениями прогресса.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=settings.THUMBNAIL_BACKFILL_CHECKPOINT,
+            help='Файл с pk последнего обработанного поста.',
+        )
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Не пересоздавать уже готовые миниатюры.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать сначала, не читая сохранённый прогресс.',
+        )
+
+    def read_checkpoint(self, path: str) -> int:
+        try:
+            with open(path) as checkpoint:
+                return int(checkpoint.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_checkpoint(self, path: str, pk: int) -> None:
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            checkpoint.write(str(pk))
+        os.replace(f'{path}.tmp', path)
+
+    def batches(
+        self,
+        after: int,
+        size: int,
+    ) -> Iterator[List[Tuple[int, str, str]]]:
+        rows = (
+            Post.objects.exclude(image='')
+            .filter(pk__gt=after)
+            .order_by('pk')
+            .values_list('pk', 'image', 'image_placeholder')
+            .iterator(chunk_size=size)
+        )
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+    def save_description(
+        self,
+        processed: Optional[images.ProcessedImage],
+    ) -> None:
+        if processed is None:
+            return
+        described = Post.objects.filter(image=processed.name)
+        scopes = set()
+        for post in described.select_related('author', 'group'):
+            scopes.update(listing_scopes(post))
+            forget_object(Post, post.pk)
+        described.update(
+            image_width=processed.width,
+            image_height=processed.height,
+            image_placeholder=processed.placeholder,
+            updated=timezone.now(),
+        )
+        bump_versions(scopes)
+
+    def handle(self, *args, **options) -> None:
+        path = options['checkpoint']
+        after = 0 if options['restart'] else self.read_checkpoint(path)
+        if after:
+            self.stdout.write(f'Продолжаем после поста {after}')
+        worker = partial(
+            thumbnails.backfill,
+            force=not options['missing_only'],
+        )
+        pool: Optional[ProcessPoolExecutor] = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=thumbnails.init_worker,
+            )
+        statuses = Counter()
+        failed = []
+        started = time.monotonic()
+        try:
+            for batch in self.batches(after, options['batch_size']):
+                names = [name for _, name, _ in batch]
+                describe = [not placeholder for _, _, placeholder in batch]
+                if pool is None:
+                    results = map(worker, names, describe)
+                else:
+                    results = pool.map(worker, names, describe, chunksize=8)
+                for name, (status, processed) in zip(names, results):
+                    statuses[status] += 1
+                    if status == 'failed':
+                        failed.append(name)
+                    self.save_description(processed)
+                self.write_checkpoint(path, batch[-1][0])
+                done = sum(statuses.values())
+                rate = done / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f'Обработано: {done}, {rate:.1f} картинок/с, '
+                    f'ошибок: {statuses["failed"]}',
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        for name in failed:
+            self.stderr.write(f'Не удалось: {name}')
+        if os.path.exists(path):
+            os.remove(path)
+        self.stdout.write(
+            'Создано: {created}, готово: {ready}, нет картинки: {missing}, '
+            'ошибок: {failed}'.format(
+                **{
+                    status: statuses[status]
+                    for status in ('created', 'ready', 'missing', 'failed')
+                },
+            ),
+        )
@@ -0,0 +1,173 @@
+import os
+import posixpath
+import sqlite3
+import tempfile
+import time
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.models import MediaFile, Post
+
+# Предел числа параметров запроса в старых версиях SQLite.
+QUERY_CHUNK = 900
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT файлы, на которые не ссылается ни один пост '
+        'и ни одна запись MediaFile, и миниатюры таких файлов. Имена '
+        'нужных файлов выгружаются из базы во временный индекс на диске, '
+        'так что память не растёт с числом файлов.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только перечислить ненужные файлы.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=QUERY_CHUNK,
+            help='Число файлов, проверяемых одним запросом к индексу.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help=(
+                'Не трогать файлы моложе стольких часов: их пост может быть '
+                'ещё не сохранён.'
+            ),
+        )
+
+    def referenced_names(self, chunk_size: int) -> Iterator[str]:
+        yield from MediaFile.objects.values_list('name', flat=True).iterator(
+            chunk_size=chunk_size,
+        )
+        images = (
+            Post.objects.exclude(image='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator(chunk_size=chunk_size)
+        )
+        for name in images:
+            yield name
+            yield from thumbnails.thumbnail_names(name)
+
+    def build_index(self, path: str, chunk_size: int) -> sqlite3.Connection:
+        index = sqlite3.connect(path)
+        index.execute(
+            'CREATE TABLE referenced (name TEXT PRIMARY KEY) WITHOUT ROWID',
+        )
+        index.executemany(
+            'INSERT OR IGNORE INTO referenced VALUES (?)',
+            ((name,) for name in self.referenced_names(chunk_size)),
+        )
+        index.commit()
+        return index
+
+    def walk(self, root: str) -> Iterator[Tuple[str, os.DirEntry]]:
+        """Файлы под `root` с путями относительно него, без рекурсии."""
+        directories = ['']
+        while directories:
+            relative = directories.pop()
+            with os.scandir(os.path.join(root, relative)) as entries:
+                for entry in entries:
+                    name = posixpath.join(relative, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield name, entry
+
+    def orphans(
+        self,
+        index: sqlite3.Connection,
+        batch: List[Tuple[str, os.DirEntry]],
+    ) -> List[Tuple[str, os.DirEntry]]:
+        referenced = set()
+        for start in range(0, len(batch), QUERY_CHUNK):
+            names = [name for name, _ in batch[start:start + QUERY_CHUNK]]
+            referenced.update(
+                name
+                for name, in index.execute(
+                    'SELECT name FROM referenced WHERE name IN (%s)'
+                    % ','.join('?' * len(names)),
+                    names,
+                )
+            )
+        return [
+            (name, entry) for name, entry in batch if name not in referenced
+        ]
+
+    def remove(self, name: str, entry: os.DirEntry) -> None:
+        """Удаляет файл и его запись в хранилище sorl.
+
+        Миниатюры ненужной картинки тоже не в индексе, поэтому их файлы
+        удаляются, когда до них дойдёт обход, а не через sorl.
+        """
+        if name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+            image_file = ImageFile(name, default.storage)
+        else:
+            image_file = thumbnails.source_file(name)
+        default.kvstore.delete(image_file, delete_thumbnails=False)
+        os.remove(entry.path)
+
+    def older_files(
+        self,
+        root: str,
+        cutoff: float,
+    ) -> Iterator[Tuple[str, os.DirEntry]]:
+        for name, entry in self.walk(root):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    yield name, entry
+            except FileNotFoundError:
+                continue
+
+    def handle(self, *args, **options) -> None:
+        root = settings.MEDIA_ROOT
+        if not os.path.isdir(root):
+            self.stdout.write(f'Каталога {root} нет')
+            return
+        cutoff = time.time() - options['min_age'] * 60 * 60
+        checked = found = freed = 0
+        with tempfile.TemporaryDirectory() as directory:
+            index = self.build_index(
+                os.path.join(directory, 'referenced.sqlite3'),
+                options['batch_size'],
+            )
+            files = self.older_files(root, cutoff)
+            try:
+                while True:
+                    batch = list(islice(files, options['batch_size']))
+                    if not batch:
+                        break
+                    checked += len(batch)
+                    for name, entry in self.orphans(index, batch):
+                        found += 1
+                        freed += entry.stat().st_size
+                        if options['dry_run']:
+                            self.stdout.write(name)
+                        else:
+                            self.remove(name, entry)
+            finally:
+                index.close()
+        self.stdout.write(
+            '{action}: {found} из {checked} файлов, {size}'.format(
+                action='Не нужны' if options['dry_run'] else 'Удалено',
+                found=found,
+                checked=checked,
+                size=filesizeformat(freed),
+            ),
+        )
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from posts import feeds
+from posts.models import Follow, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает разделение авторов на раздаваемых в ленты и '
+        'подмешиваемых при чтении и оценивает усиление записи.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            '--rebalance',
+            action='store_true',
+            help=(
+                'Перевести авторов, пересёкших пороги подписчиков, на '
+                'другой способ доставки и перестроить их ленты.'
+            ),
+        )
+
+    def per_author(self, model: type) -> Subquery:
+        return Subquery(
+            model.objects.filter(author=OuterRef('pk'))
+            .order_by()
+            .values('author')
+            .annotate(total=Count('pk'))
+            .values('total'),
+        )
+
+    def rebalance(self) -> None:
+        switches = feeds.pending_switches().values_list('pk', 'celebrity')
+        for author_id, celebrity in switches.iterator():
+            if celebrity:
+                feeds.demote(author_id)
+            else:
+                feeds.promote(author_id)
+            self.stdout.write(
+                f'Автор {author_id}: '
+                f'{"раздаётся" if celebrity else "подмешивается"}',
+            )
+
+    def handle(self, *args, **options) -> None:
+        if options['rebalance']:
+            self.rebalance()
+        authors = (
+            User.objects.annotate(
+                followers=self.per_author(Follow),
+                posts_total=self.per_author(Post),
+                celebrity=Coalesce('counters__celebrity', Value(False)),
+            )
+            .filter(followers__gt=0)
+            .values_list('followers', 'posts_total', 'celebrity')
+        )
+        stats = {
+            False: {'authors': 0, 'posts': 0, 'writes': 0},
+            True: {'authors': 0, 'posts': 0, 'writes': 0},
+        }
+        for followers, posts_total, celebrity in authors.iterator():
+            group = stats[celebrity]
+            group['authors'] += 1
+            group['posts'] += posts_total or 0
+            group['writes'] += followers * (posts_total or 0)
+        self.report(stats)
+
+    def report(self, stats: dict) -> None:
+        pushed, pulled = stats[False], stats[True]
+        self.stdout.write(
+            f'Пороги подписчиков: {settings.FEED_CELEBRITY_FOLLOWERS}, '
+            f'обратно — ниже {settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS}',
+        )
+        for title, group in (('раздаются', pushed), ('подмешиваются', pulled)):
+            self.stdout.write(
+                f'{title}: авторов {group["authors"]}, '
+                f'постов {group["posts"]}',
+            )
+        posts_total = pushed['posts'] + pulled['posts']
+        if not posts_total:
+            return
+        hybrid = pushed['writes'] / posts_total
+        push_only = (pushed['writes'] + pulled['writes']) / posts_total
+        self.stdout.write(
+            f'Записей в ленты на пост: {hybrid:.1f} '
+            f'(при раздаче всех авторов {push_only:.1f})',
+        )
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.caching import bump_versions, forget_object
+from posts.models import MediaFile, Post
+from posts.signals import listing_scopes
+from posts.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов, сохранённые до перехода на хранилище '
+        'с адресацией по содержимому, в подкаталоги по хэшу и объединяет '
+        'одинаковые файлы. Повторный запуск продолжает перенос.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help=(
+                'Не удалять старые файлы, например пока не истекли '
+                'закэшированные страницы со ссылками на них.'
+            ),
+        )
+
+    def handle(self, *args, **options) -> None:
+        names = (
+            Post.objects.exclude(image='')
+            .order_by()
+            .values_list('image')
+            .annotate(posts=Count('pk'))
+        )
+        moved = shared = missing = 0
+        for name, posts in names.iterator():
+            if image_storage.is_addressed(name):
+                continue
+            if not image_storage.exists(name):
+                missing += 1
+                continue
+            with transaction.atomic():
+                with image_storage.open(name) as file:
+                    new_name = image_storage.save(name, file)
+                if posts > 1:
+                    image_storage.acquire(new_name, posts - 1)
+                shared += MediaFile.objects.filter(
+                    name=new_name,
+                    refs__gt=posts,
+                ).exists()
+                moved_posts = Post.objects.filter(image=name)
+                scopes = set()
+                for post in moved_posts.select_related('author', 'group'):
+                    scopes.update(listing_scopes(post))
+                    forget_object(Post, post.pk)
+                moved_posts.update(image=new_name, updated=timezone.now())
+            bump_versions(scopes)
+            if not options['keep_originals']:
+                image_storage.delete(name)
+            moved += 1
+        self.stdout.write(
+            f'Перенесено файлов: {moved}, из них совпали с уже '
+            f'сохранёнными: {shared}, не найдено: {missing}',
+        )
+        if moved:
+            self.stdout.write(
+                'Миниатюры для новых имён создаст команда warm_thumbnails',
+            )
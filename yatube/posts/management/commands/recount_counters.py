@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, комментариев и подписок '
+        'пользователей, постов и групп по данным в базе.'
+    )
+
+    def handle(self, *args, **options) -> None:
+        updated = counters.recount()
+        self.stdout.write(
+            'Пересчитано пользователей: {users} (новых: {created}), '
+            'постов: {posts}, групп: {groups}'.format(**updated),
+        )
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core.utils import feed_count_key
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики записей лент в кэше. Кэш по умолчанию '
+        'должен быть общим для команды и веб-процессов (Memcached, Redis, '
+        'файлы): в LocMemCache счётчики останутся в памяти самой команды.'
+    )
+
+    def handle(self, *args, **options) -> None:
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise CommandError(
+                'Кэш по умолчанию у каждого процесса свой, и веб-процессы '
+                'не увидят счётчиков: настройте общий кэш в CACHES.',
+            )
+        counts = {'index': Post.objects.count()}
+        for field in ('author', 'group'):
+            rows = (
+                Post.objects.filter(**{f'{field}__isnull': False})
+                .order_by()
+                .values_list(field)
+                .annotate(total=Count('pk'))
+            )
+            counts.update(
+                (f'{field}:{pk}', total) for pk, total in rows.iterator()
+            )
+        cache.set_many(
+            {feed_count_key(scope): total for scope, total in counts.items()},
+            settings.FEED_COUNT_TIMEOUT,
+        )
+        self.stdout.write(f'Обновлено счётчиков: {len(counts)}')
@@ -0,0 +1,74 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет хранилище sorl миниатюрами картинок постов: проверяет '
+        'записи и создаёт недостающие миниатюры в пуле процессов.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Число процессов; 0 — без пула.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Число картинок, которые пул получает за раз.',
+        )
+
+    def batches(self, size: int) -> Iterator[List[str]]:
+        names = (
+            Post.objects.exclude(image='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator(chunk_size=size)
+        )
+        while True:
+            batch = list(islice(names, size))
+            if not batch:
+                return
+            yield batch
+
+    def handle(self, *args, **options) -> None:
+        pool: Optional[ProcessPoolExecutor] = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=thumbnails.init_worker,
+            )
+        statuses = Counter()
+        try:
+            for batch in self.batches(options['batch_size']):
+                if pool is None:
+                    statuses.update(map(thumbnails.warm, batch))
+                else:
+                    statuses.update(
+                        pool.map(thumbnails.warm, batch, chunksize=16),
+                    )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(
+            'Готово: {ready}, создано: {created}, нет картинки: '
+            '{missing}'.format(
+                **{
+                    status: statuses[status]
+                    for status in ('ready', 'created', 'missing')
+                },
+            ),
+        )
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_celebrities(apps, schema_editor):
+    # До флага авторы подмешивались при чтении по одному порогу.
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    celebrities = UserCounters.objects.filter(
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    )
+    celebrities.update(celebrity=True)
+    # Их посты 0016 разложил по лентам, а чтение эти записи уже не берёт.
+    FeedEntry.objects.filter(
+        author__in=celebrities.values('user'),
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='celebrity',
+            field=models.BooleanField(
+                default=False,
+                verbose_name='посты подмешиваются в ленты при чтении',
+            ),
+        ),
+        migrations.RunPython(mark_celebrities, migrations.RunPython.noop),
+    ]
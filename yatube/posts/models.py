@@ -1,7 +1,11 @@
+from typing import Iterable, Optional, Tuple
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from posts.storage import image_storage
+
 User = get_user_model()
 
 
@@ -20,7 +24,40 @@ class PublicateModel(models.Model):
         return self.text[:settings.STRING_SIZE]  # fmt: skip
 
 
-class Group(models.Model):
+class CountedModel(models.Model):
+    """Модель с денормализованными счётчиками.
+
+    Поля из `counter_fields` меняют только выражения F() в
+    posts.counters. save() существующей записи их не пишет: иначе
+    значение, прочитанное до правки, затёрло бы изменения, сделанные за
+    это время другими запросами.
+    """
+
+    counter_fields: Tuple[str, ...] = ()
+
+    class Meta:
+        abstract = True
+
+    def save(
+        self,
+        force_insert: bool = False,
+        force_update: bool = False,
+        using: Optional[str] = None,
+        update_fields: Optional[Iterable[str]] = None,
+    ) -> None:
+        if update_fields is None and not force_insert and not (
+            self._state.adding
+        ):
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class Group(CountedModel):
     namemaxlength = 200
 
     title = models.CharField(
@@ -32,6 +69,13 @@ class Group(models.Model):
         verbose_name='ссылка',
     )
     description = models.TextField(verbose_name='описание')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число постов',
+    )
+
+    counter_fields = ('posts_count',)
 
     class Meta:
         verbose_name = 'группа'
@@ -41,7 +85,29 @@ class Group(models.Model):
         return self.title
 
 
-class Post(PublicateModel):
+class PostQuerySet(models.QuerySet):
+    card_fields = (
+        'text',
+        'pub_date',
+        'updated',
+        'image',
+        'image_width',
+        'image_height',
+        'image_placeholder',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__slug',
+        'group__title',
+    )
+
+    def for_feed(self) -> 'PostQuerySet':
+        """Посты для лент: автор и группа одним запросом, только поля,
+        которые выводит карточка поста."""
+        return self.select_related('author', 'group').only(*self.card_fields)
+
+
+class Post(PublicateModel, CountedModel):
     text = models.TextField(verbose_name='текст поста')
     author = models.ForeignKey(
         User,
@@ -60,12 +126,57 @@ class Post(PublicateModel):
     image = models.ImageField(
         blank=True,
         upload_to='posts/',
+        storage=image_storage,
         verbose_name='картинка',
     )
+    image_width = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='ширина картинки',
+    )
+    image_height = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='высота картинки',
+    )
+    image_placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='заглушка картинки',
+    )
+    updated = models.DateTimeField(
+        verbose_name='дата изменения',
+        auto_now=True,
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число комментариев',
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    counter_fields = ('comments_count',)
 
     class Meta:
         verbose_name = 'пост'
         verbose_name_plural = 'посты'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
 
 class Comment(PublicateModel):
@@ -90,6 +201,12 @@ class Comment(PublicateModel):
     class Meta:
         verbose_name = 'комментарий'
         verbose_name_plural = 'комментарии'
+        indexes = [
+            models.Index(
+                fields=('post', '-pub_date', '-id'),
+                name='comment_post_pub_date_idx',
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -106,16 +223,114 @@ class Follow(models.Model):
         verbose_name='автор',
     )
 
-    constraints = [
-        models.UniqueConstraint(
-            fields=('user', 'author'),
-            name='unique_users',
-        ),
-    ]
-
     class Meta:
         verbose_name = 'подписчик'
         verbose_name_plural = 'подписчики'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_users',
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user} подписан на {self.author}'
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, которые поддерживают сигналы.
+
+    Пересчитать их заново можно командой recount_counters.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число постов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число подписок',
+    )
+    celebrity = models.BooleanField(
+        default=False,
+        verbose_name='посты подмешиваются в ленты при чтении',
+    )
+
+    class Meta:
+        verbose_name = 'счётчики пользователя'
+        verbose_name_plural = 'счётчики пользователей'
+
+    def __str__(self) -> str:
+        return f'Счётчики {self.user}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='читатель ленты',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='автор поста',
+    )
+    pub_date = models.DateTimeField(verbose_name='дата публикации поста')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'запись ленты подписок'
+        verbose_name_plural = 'записи ленты подписок'
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='feedentry_user_feed_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_feed_entry',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.post} в ленте {self.user}'
+
+
+class MediaFile(models.Model):
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='имя файла',
+    )
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число ссылок',
+    )
+
+    class Meta:
+        verbose_name = 'файл медиа'
+        verbose_name_plural = 'файлы медиа'
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.refs})'
@@ -0,0 +1,324 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.caching import bump_versions, forget_object
+from core.utils import feed_count_key
+from posts import counters, feeds
+from posts.models import Comment, Follow, Group, Post, User, UserCounters
+from posts.storage import image_storage
+
+
+# Поля пользователя, которые видны на страницах с его постами.
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+# Модели в кэше объектов и поля, по которым их ищут, кроме pk.
+CACHED_OBJECTS = {
+    Post: (),
+    Group: ('slug',),
+    User: ('username',),
+    UserCounters: (),
+}
+
+
+def post_scopes(post: Post) -> list:
+    scopes = ['index', f'author:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def shift_feed_count(scope: str, delta: int) -> None:
+    try:
+        cache.incr(feed_count_key(scope), delta)
+    except ValueError:
+        pass
+
+
+def shift_feed_counts(post: Post, delta: int) -> None:
+    for scope in post_scopes(post):
+        shift_feed_count(scope, delta)
+
+
+def listing_scopes(post: Post) -> list:
+    scopes = ['index', f'author:{post.author.username}', f'post:{post.pk}']
+    if post.group_id:
+        scopes.append(f'group:{post.group.slug}')
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_values(sender: type, instance: Post, **kwargs) -> None:
+    instance.previous_group_slug = instance.previous_image = None
+    instance.previous_group_id = instance.previous_author_id = None
+    # Новая загрузка ещё не сохранена: ссылку на файл storage возьмёт
+    # позже, в pre_save поля.
+    instance.image_uploaded = bool(instance.image) and not (
+        instance.image._committed
+    )
+    if instance.pk:
+        (
+            instance.previous_group_id,
+            instance.previous_group_slug,
+            instance.previous_author_id,
+            instance.previous_image,
+        ) = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'group__slug', 'author_id', 'image')
+            .first()
+        ) or (None, None, None, None)
+
+
+@receiver(post_save, sender=Post)
+def expire_saved_post_listings(
+    sender: type,
+    instance: Post,
+    **kwargs,
+) -> None:
+    scopes = listing_scopes(instance)
+    if instance.previous_group_slug:
+        scopes.append(f'group:{instance.previous_group_slug}')
+    bump_versions(scopes)
+
+
+@receiver(post_delete, sender=Post)
+def expire_deleted_post_listings(
+    sender: type,
+    instance: Post,
+    **kwargs,
+) -> None:
+    bump_versions(listing_scopes(instance))
+
+
+@receiver(pre_save, sender=Group)
+def remember_previous_slug(sender: type, instance: Group, **kwargs) -> None:
+    instance.previous_slug = instance.pk and (
+        Group.objects.filter(pk=instance.pk)
+        .values_list('slug', flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def expire_group_listing(sender: type, instance: Group, **kwargs) -> None:
+    # Ссылки на группу есть и в общих лентах, их сбрасывает `groups`.
+    scopes = {f'group:{instance.slug}', 'groups'}
+    if getattr(instance, 'previous_slug', None):
+        scopes.add(f'group:{instance.previous_slug}')
+    bump_versions(scopes)
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_names(
+    sender: type,
+    instance: User,
+    update_fields=None,
+    **kwargs,
+) -> None:
+    instance.previous_names = None
+    # Вход обновляет только last_login, и лишний запрос ему не нужен.
+    if update_fields is not None and not set(update_fields) & set(
+        USER_DISPLAY_FIELDS,
+    ):
+        return
+    if instance.pk:
+        instance.previous_names = (
+            User.objects.filter(pk=instance.pk)
+            .values_list(*USER_DISPLAY_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=User)
+def expire_renamed_author_pages(
+    sender: type,
+    instance: User,
+    **kwargs,
+) -> None:
+    """Сбрасывает страницы, где видны прежние имя и логин автора.
+
+    Кроме профиля по старому и новому логину меняется поколение `users`:
+    от него зависят ленты и страницы постов с именами многих авторов.
+    """
+    previous = instance.previous_names
+    if previous is None or previous == tuple(
+        getattr(instance, field) for field in USER_DISPLAY_FIELDS
+    ):
+        return
+    bump_versions(
+        {f'author:{previous[0]}', f'author:{instance.username}', 'users'},
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_post_page(sender: type, instance: Comment, **kwargs) -> None:
+    bump_versions([f'post:{instance.post_id}'])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def expire_author_listing(sender: type, instance: Follow, **kwargs) -> None:
+    bump_versions([f'author:{instance.author.username}'])
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(
+    sender: type,
+    instance: Post,
+    created: bool,
+    **kwargs,
+) -> None:
+    if created:
+        shift_feed_counts(instance, 1)
+        cache.delete(feeds.author_stream_key(instance.author_id))
+        feeds.fan_out(instance)
+    elif instance.previous_group_id != instance.group_id:
+        if instance.previous_group_id:
+            shift_feed_count(f'group:{instance.previous_group_id}', -1)
+        if instance.group_id:
+            shift_feed_count(f'group:{instance.group_id}', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender: type, instance: Post, **kwargs) -> None:
+    shift_feed_counts(instance, -1)
+    cache.delete(feeds.author_stream_key(instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+def fill_follow_feed(
+    sender: type,
+    instance: Follow,
+    created: bool,
+    **kwargs,
+) -> None:
+    if not created:
+        return
+    if not feeds.is_celebrity(instance.author_id):
+        feeds.backfill(instance)
+    feeds.note_crossing(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def purge_follow_feed(sender: type, instance: Follow, **kwargs) -> None:
+    feeds.purge(instance)
+    feeds.note_crossing(instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(
+    sender: type,
+    instance: User,
+    created: bool,
+    raw: bool = False,
+    **kwargs,
+) -> None:
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(
+    sender: type,
+    instance: Post,
+    created: bool,
+    **kwargs,
+) -> None:
+    if created:
+        counters.shift_user(instance.author_id, posts_count=1)
+        counters.shift_group(instance.group_id, 1)
+        return
+    if instance.previous_author_id != instance.author_id:
+        counters.shift_user(instance.previous_author_id, posts_count=-1)
+        counters.shift_user(instance.author_id, posts_count=1)
+    if instance.previous_group_id != instance.group_id:
+        counters.shift_group(instance.previous_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender: type, instance: Post, **kwargs) -> None:
+    counters.shift_user(instance.author_id, posts_count=-1)
+    counters.shift_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(
+    sender: type,
+    instance: Comment,
+    created: bool,
+    **kwargs,
+) -> None:
+    if created:
+        counters.shift_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(
+    sender: type,
+    instance: Comment,
+    **kwargs,
+) -> None:
+    counters.shift_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(
+    sender: type,
+    instance: Follow,
+    created: bool,
+    **kwargs,
+) -> None:
+    if created:
+        counters.shift_user(instance.author_id, followers_count=1)
+        counters.shift_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_deleted_follow(sender: type, instance: Follow, **kwargs) -> None:
+    counters.shift_user(instance.author_id, followers_count=-1)
+    counters.shift_user(instance.user_id, following_count=-1)
+
+
+def release_image(name: str) -> None:
+    """Снимает ссылку на картинку после фиксации транзакции.
+
+    Файлы, сохранённые до перехода на адресацию по содержимому, ссылок не
+    учитывают и не удаляются.
+    """
+    if name and image_storage.is_addressed(name):
+        transaction.on_commit(lambda: image_storage.delete(name))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender: type, instance: Post, **kwargs) -> None:
+    # Повторная загрузка того же файла взяла ещё одну ссылку на него же.
+    if (
+        instance.previous_image != instance.image.name
+        or instance.image_uploaded
+    ):
+        release_image(instance.previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender: type, instance: Post, **kwargs) -> None:
+    release_image(instance.image.name)
+
+
+def forget_cached_object(sender: type, instance: object, **kwargs) -> None:
+    forget_object(
+        sender,
+        instance.pk,
+        **{
+            field: getattr(instance, field)
+            for field in CACHED_OBJECTS[sender]
+        },
+    )
+
+
+for model in CACHED_OBJECTS:
+    post_save.connect(forget_cached_object, sender=model)
+    post_delete.connect(forget_cached_object, sender=model)
@@ -0,0 +1,134 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под SHA-256 своего содержимого и раскладывается по
+подкаталогам из первых символов хэша: `posts/ab/cd/abcd….jpg`. Хэш
+считается в том же проходе, в котором загрузка пишется во временный
+файл, и одинаковые файлы хранятся один раз. Число ссылок на файл
+хранится в MediaFile: delete() уменьшает его и удаляет файл только вместе
+с последней ссылкой.
+
+Решения «файл уже есть» в _save() и «ссылка последняя» в delete()
+принимаются под блокировкой строки MediaFile в одной транзакции, поэтому
+сохранение не выбросит свою копию файла, который как раз удаляется.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from typing import Optional
+
+from django.apps import apps
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+ADDRESSED_NAME = re.compile(
+    r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.\w+$',
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    incoming_dir = '.incoming'
+
+    def get_available_name(
+        self,
+        name: str,
+        max_length: Optional[int] = None,
+    ) -> str:
+        return name
+
+    def _save(self, name: str, content: File) -> str:
+        directory, filename = posixpath.split(name)
+        addressed = ADDRESSED_NAME.search(name)
+        if addressed:
+            directory = name[:addressed.start()]  # fmt: skip
+        extension = os.path.splitext(filename)[1].lower()
+        incoming = self.path(self.incoming_dir)
+        os.makedirs(incoming, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=incoming)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(
+                directory,
+                hexdigest[:2],
+                hexdigest[2:4],
+                f'{hexdigest}{extension}',
+            )
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with transaction.atomic():
+                # Ссылка берётся до проверки: пока строка заблокирована,
+                # delete() не удалит файл.
+                self.acquire(name)
+                if os.path.exists(path):
+                    os.remove(temporary)
+                else:
+                    if self.file_permissions_mode is not None:
+                        os.chmod(temporary, self.file_permissions_mode)
+                    os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def acquire(self, name: str, count: int = 1) -> None:
+        """Добавляет файлу `count` ссылок и блокирует его строку MediaFile
+        до конца транзакции."""
+        media_file = apps.get_model('posts', 'MediaFile')
+        with transaction.atomic():
+            while not media_file.objects.filter(name=name).update(
+                refs=F('refs') + count,
+            ):
+                # Строки нет или её только что удалил delete().
+                _, created = media_file.objects.get_or_create(
+                    name=name,
+                    defaults={'refs': count},
+                )
+                if created:
+                    return
+
+    def delete(self, name: str) -> None:
+        """Снимает ссылку на файл и удаляет его вместе с последней.
+
+        Файлы без учёта ссылок, сохранённые до перехода на это хранилище,
+        удаляются сразу. Файл с адресом, но без строки MediaFile, не
+        трогается: его ссылки уже сняты, а новую, возможно, берёт
+        параллельный _save().
+        """
+        if not self.is_addressed(name):
+            super().delete(name)
+            return
+        media_file = apps.get_model('posts', 'MediaFile')
+        with transaction.atomic():
+            refs = (
+                media_file.objects.select_for_update()
+                .filter(name=name)
+                .values_list('refs', flat=True)
+                .first()
+            )
+            if refs is None:
+                return
+            if refs > 1:
+                media_file.objects.filter(name=name).update(
+                    refs=F('refs') - 1,
+                )
+                return
+            media_file.objects.filter(name=name).delete()
+            super().delete(name)
+
+    @staticmethod
+    def is_addressed(name: str) -> bool:
+        return bool(ADDRESSED_NAME.search(name))
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,58 @@
+from typing import Dict
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.template.loader import render_to_string
+from django.utils.safestring import SafeText, mark_safe
+
+from core.caching import versions_of
+from posts import thumbnails
+from posts.models import Post
+
+register = template.Library()
+
+
+def card_key(post: Post, users: int) -> str:
+    return f'post_card:{post.pk}:{post.updated.timestamp()}:{users}'
+
+
+def page_cards(page: Page) -> Dict[int, str]:
+    """Берёт карточки всех постов страницы из кэша одним get_many,
+    а недостающие рендерит и сохраняет одним set_many.
+
+    Миниатюры для недостающих карточек ищутся одним обращением к
+    хранилищу sorl. Карточки с оригиналом вместо ещё не готовой
+    миниатюры не кэшируются. Имя автора в карточке меняется без записи
+    поста, поэтому в ключе есть и поколение `users`.
+    """
+    users = versions_of(['users'])['users']
+    keys = {card_key(post, users): post for post in page}
+    cards = cache.get_many(keys)
+    thumbnails.resolve_thumbnails(
+        post for key, post in keys.items() if key not in cards
+    )
+    missing = {
+        key: render_to_string('includes/post.html', {'post': post})
+        for key, post in keys.items()
+        if key not in cards
+    }
+    cache.set_many(
+        {
+            key: card
+            for key, card in missing.items()
+            if not getattr(keys[key], 'thumbnail_pending', False)
+        },
+        settings.POST_CARD_TIMEOUT,
+    )
+    cards.update(missing)
+    return {keys[key].pk: card for key, card in cards.items()}
+
+
+@register.simple_tag
+def post_card(post: Post, page: Page) -> SafeText:
+    """Выводит карточку поста из кэша фрагментов страницы `page`."""
+    if not hasattr(page, 'cards'):
+        page.cards = page_cards(page)
+    return mark_safe(page.cards[post.pk])
@@ -0,0 +1,48 @@
+from django import template
+
+from posts import thumbnails
+from posts.models import Post
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post: Post, lazy: bool = True) -> dict:
+    """Выводит картинку поста с вариантами разной ширины в srcset.
+
+    Берёт миниатюры, найденные заранее resolve_thumbnails(), а если их не
+    искали, обращается к хранилищу sorl. Пока основной миниатюры нет,
+    ставит генерацию в очередь и выводит оригинал, а пост помечает флагом
+    thumbnail_pending. Размеры берутся из полей поста, файлы не
+    открываются. Картинку в начале страницы стоит выводить с
+    lazy=False.
+    """
+    if not post.image:
+        return {}
+    if hasattr(post, 'thumbnails'):
+        variants = post.thumbnails
+    else:
+        variants = thumbnails.ready_variants(post.image)
+    image = {'placeholder': post.image_placeholder, 'lazy': lazy}
+    main = variants.get(thumbnails.CARD_WIDTH)
+    if main is None:
+        post.thumbnail_pending = True
+        thumbnails.schedule(post)
+        image.update(
+            src=post.image.url,
+            width=post.image_width,
+            height=post.image_height,
+        )
+        return image
+    image.update(
+        src=main.url,
+        srcset=', '.join(
+            f'{thumbnail.url} {width}w'
+            for width, thumbnail in sorted(variants.items())
+            if thumbnail is not None
+        ),
+        sizes=thumbnails.CARD_SIZES,
+        width=thumbnails.CARD_WIDTH,
+        height=thumbnails.CARD_HEIGHT,
+    )
+    return image
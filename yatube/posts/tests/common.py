@@ -1,6 +1,11 @@
+import mimetypes
 import secrets
+from io import BytesIO
+from pathlib import Path
+from typing import Tuple
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 
 def image(name: str = 'test_image.jpg') -> SimpleUploadedFile:
@@ -9,3 +14,19 @@ def image(name: str = 'test_image.jpg') -> SimpleUploadedFile:
         content=secrets.token_bytes(600 * 300),
         content_type='image/jpeg',
     )
+
+
+def picture(
+    name: str = 'test_picture.png',
+    size: Tuple[int, int] = (600, 300),
+    **options,
+) -> SimpleUploadedFile:
+    buffer = BytesIO()
+    image = Image.new('RGB', size, 'teal')
+    format_ = Image.registered_extensions()[Path(name).suffix]
+    image.save(buffer, format_, **options)
+    return SimpleUploadedFile(
+        name=name,
+        content=buffer.getvalue(),
+        content_type=mimetypes.guess_type(name)[0],
+    )
@@ -0,0 +1,286 @@
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+from sorl.thumbnail import default
+
+from core.caching import cached_object
+from core.utils import feed_count_key
+from posts import thumbnails
+from posts.models import Follow, MediaFile, Post
+from posts.storage import image_storage
+from posts.tests import common
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+DBM_FILE = Path(tempfile.mkdtemp()) / 'kvstore'
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(DBM_FILE.parent, ignore_errors=True)
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(DBM_FILE.parent / 'cache'),
+        },
+    },
+)
+class RefreshFeedCountsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = mixer.cycle(2).blend(User)
+        cls.group = mixer.blend('posts.Group')
+        mixer.cycle(3).blend('posts.Post', author=cls.user[0], group=cls.group)
+        mixer.cycle(2).blend('posts.Post', author=cls.user[1], group=None)
+        Follow.objects.create(user=cls.user[1], author=cls.user[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_command_fills_every_scope(self):
+        call_command('refresh_feed_counts', stdout=StringIO())
+        expected = {
+            'index': 5,
+            f'author:{self.user[0].pk}': 3,
+            f'author:{self.user[1].pk}': 2,
+            f'group:{self.group.pk}': 3,
+        }
+        for scope, total in expected.items():
+            with self.subTest(scope=scope):
+                self.assertEqual(cache.get(feed_count_key(scope)), total)
+
+    def test_command_refuses_per_process_cache(self):
+        with override_settings(
+            CACHES={
+                'default': {
+                    'BACKEND': (
+                        'django.core.cache.backends.locmem.LocMemCache'
+                    ),
+                },
+            },
+        ):
+            with self.assertRaises(CommandError):
+                call_command('refresh_feed_counts', stdout=StringIO())
+
+    def test_signals_keep_counters_in_step(self):
+        call_command('refresh_feed_counts', stdout=StringIO())
+        post = mixer.blend('posts.Post', author=self.user[1], group=None)
+        self.assertEqual(cache.get(feed_count_key('index')), 6)
+        post.delete()
+        self.assertEqual(cache.get(feed_count_key('index')), 5)
+
+    def test_moved_post_shifts_group_counters(self):
+        call_command('refresh_feed_counts', stdout=StringIO())
+        other = mixer.blend('posts.Group')
+        cache.set(feed_count_key(f'group:{other.pk}'), 0)
+        post = Post.objects.filter(group=self.group).first()
+        post.group = other
+        post.save()
+        for group, total in ((self.group, 2), (other, 1)):
+            self.assertEqual(
+                cache.get(feed_count_key(f'group:{group.pk}')),
+                total,
+            )
+
+    def test_new_post_does_not_touch_follower_keys(self):
+        with mock.patch.object(cache, 'delete_many') as delete_many:
+            mixer.blend('posts.Post', author=self.user[0])
+        delete_many.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_DBM_FILE=DBM_FILE)
+class WarmThumbnailsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear()
+
+    def test_command_creates_missing_thumbnails(self):
+        author = mixer.blend(User)
+        post = mixer.blend('posts.Post', author=author, image=common.picture())
+        mixer.blend('posts.Post', author=author, image='posts/lost.png')
+        out = StringIO()
+        call_command('warm_thumbnails', workers=0, stdout=out)
+        self.assertIn('создано: 1, нет картинки: 1', out.getvalue())
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+
+        out = StringIO()
+        call_command('warm_thumbnails', workers=0, stdout=out)
+        self.assertIn('Готово: 1, создано: 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_DBM_FILE=DBM_FILE)
+class BackfillThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = mixer.blend(User)
+        cls.posts = [
+            mixer.blend(
+                'posts.Post',
+                author=author,
+                image=common.picture(size=(600, 300 + number)),
+                image_placeholder='',
+            )
+            for number in range(3)
+        ]
+        mixer.blend('posts.Post', author=author, image='posts/broken.png')
+        cls.checkpoint = str(DBM_FILE.parent / 'checkpoint')
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear()
+
+    def backfill(self, **options) -> str:
+        out = StringIO()
+        call_command(
+            'backfill_thumbnails',
+            workers=0,
+            batch_size=2,
+            checkpoint=self.checkpoint,
+            stdout=out,
+            stderr=StringIO(),
+            **options,
+        )
+        return out.getvalue()
+
+    def test_command_regenerates_every_thumbnail(self):
+        self.backfill()
+        output = self.backfill()
+        self.assertIn('Создано: 3, готово: 0, нет картинки: 1', output)
+        for number, post in enumerate(self.posts):
+            self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+            post.refresh_from_db()
+            self.assertEqual(
+                (post.image_width, post.image_height),
+                (600, 300 + number),
+            )
+            self.assertTrue(post.image_placeholder)
+
+    def test_described_posts_leave_object_cache(self):
+        post = self.posts[0]
+        cached_object(Post, pk=post.pk)
+        self.backfill()
+        cached = cached_object(Post, pk=post.pk)
+        self.assertTrue(cached.image_placeholder)
+        self.assertGreater(cached.updated, post.updated)
+
+    def test_command_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as checkpoint:
+            checkpoint.write(str(self.posts[1].pk))
+        output = self.backfill(missing_only=True)
+        self.assertIn(f'Продолжаем после поста {self.posts[1].pk}', output)
+        self.assertIn('Обработано: 2,', output)
+        self.assertIsNone(thumbnails.ready_thumbnail(self.posts[0].image))
+        self.assertFalse(Path(self.checkpoint).exists())
+
+    def test_broken_image_is_reported(self):
+        broken = mixer.blend('posts.Post', image=common.image('broken.jpg'))
+        err = StringIO()
+        call_command(
+            'backfill_thumbnails',
+            workers=0,
+            checkpoint=self.checkpoint,
+            stdout=StringIO(),
+            stderr=err,
+        )
+        self.assertIn(broken.image.name, err.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MigrateMediaTest(TestCase):
+    def test_command_moves_and_deduplicates_legacy_files(self):
+        legacy = FileSystemStorage()
+        content = common.picture().read()
+        legacy.save('posts/one.png', ContentFile(content))
+        legacy.save('posts/two.png', ContentFile(content))
+        author = mixer.blend(User)
+        for name in ('posts/one.png', 'posts/one.png', 'posts/two.png'):
+            mixer.blend('posts.Post', author=author, image=name)
+        out = StringIO()
+        call_command('migrate_media', stdout=out)
+        self.assertIn(
+            'Перенесено файлов: 2, из них совпали с уже сохранёнными: 1',
+            out.getvalue(),
+        )
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(image_storage.is_addressed(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 3)
+        self.assertFalse(legacy.exists('posts/one.png'))
+        self.assertFalse(legacy.exists('posts/two.png'))
+
+
+@override_settings(THUMBNAIL_DBM_FILE=DBM_FILE)
+class CollectMediaGarbageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        cache.clear()
+        default.kvstore.clear()
+        author = mixer.blend(User)
+        self.kept = mixer.blend(
+            'posts.Post',
+            author=author,
+            image=common.picture(size=(500, 200)),
+        )
+        removed = mixer.blend(
+            'posts.Post',
+            author=author,
+            image=common.picture(size=(500, 201)),
+        )
+        for post in (self.kept, removed):
+            thumbnails.generate(post.image.name)
+        self.removed = removed.image.name
+        # Файл и миниатюры остались от поста, удалённого до учёта ссылок.
+        Post.objects.filter(pk=removed.pk).delete()
+        MediaFile.objects.filter(name=self.removed).delete()
+        Path(self.media_root, 'posts', 'stray.txt').write_text('x')
+
+    def collect(self, **options) -> str:
+        out = StringIO()
+        call_command('collect_media_garbage', min_age=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_lists_orphans(self):
+        output = self.collect(dry_run=True)
+        self.assertIn(self.removed, output)
+        self.assertIn('posts/stray.txt', output)
+        self.assertIn('Не нужны: 5 из 9 файлов', output)
+        self.assertTrue(image_storage.exists(self.removed))
+
+    def test_orphans_and_their_thumbnails_are_removed(self):
+        orphan_thumbnails = thumbnails.thumbnail_names(self.removed)
+        output = self.collect(batch_size=3)
+        self.assertIn('Удалено: 5 из 9 файлов', output)
+        self.assertFalse(image_storage.exists(self.removed))
+        for name in orphan_thumbnails:
+            self.assertFalse(default.storage.exists(name))
+        self.assertTrue(image_storage.exists(self.kept.image.name))
+        for name in thumbnails.thumbnail_names(self.kept.image.name):
+            self.assertTrue(default.storage.exists(name))
+        self.assertIsNotNone(thumbnails.ready_thumbnail(self.kept.image))
+
+    def test_recent_files_are_kept(self):
+        out = StringIO()
+        call_command('collect_media_garbage', stdout=out)
+        self.assertIn('Удалено: 0 из 0 файлов', out.getvalue())
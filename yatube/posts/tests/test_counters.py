@@ -0,0 +1,138 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from posts.models import Follow, Group, Post, UserCounters
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author, cls.reader = mixer.cycle(2).blend(User)
+        cls.group, cls.other_group = mixer.cycle(2).blend('posts.Group')
+
+    def counters(self, user):
+        counters = UserCounters.objects.get(user=user)
+        return (
+            counters.posts_count,
+            counters.followers_count,
+            counters.following_count,
+        )
+
+    def test_new_users_get_counters(self):
+        self.assertEqual(self.counters(mixer.blend(User)), (0, 0, 0))
+
+    def test_posts_are_counted_for_author_and_group(self):
+        post = mixer.blend(
+            'posts.Post',
+            author=self.author,
+            group=self.group,
+            image='',
+        )
+        mixer.blend('posts.Post', author=self.author, group=None, image='')
+        self.assertEqual(self.counters(self.author)[0], 2)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 0)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count,
+            1,
+        )
+
+        post.delete()
+        self.assertEqual(self.counters(self.author)[0], 1)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count,
+            0,
+        )
+
+    def test_delete_of_uncounted_post_keeps_counters_at_zero(self):
+        # bulk_create не шлёт сигналов, и счётчики остаются нулевыми.
+        Post.objects.bulk_create(
+            [Post(author=self.author, group=self.group, text='Без счётчика')],
+        )
+        post = Post.objects.get(group=self.group)
+        mixer.blend('posts.Comment', post=post)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        post.delete()
+        self.assertEqual(self.counters(self.author)[0], 0)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 0)
+
+    def test_comments_are_counted_for_post(self):
+        post = mixer.blend('posts.Post', author=self.author, image='')
+        comments = mixer.cycle(3).blend('posts.Comment', post=post)
+        comments[0].delete()
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 2)
+
+    def test_follows_are_counted_on_both_sides(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.counters(self.author)[1:], (1, 0))
+        self.assertEqual(self.counters(self.reader)[1:], (0, 1))
+        follow.delete()
+        self.assertEqual(self.counters(self.author)[1:], (0, 0))
+        self.assertEqual(self.counters(self.reader)[1:], (0, 0))
+
+    def test_command_repairs_drifted_counters(self):
+        post = mixer.blend(
+            'posts.Post',
+            author=self.author,
+            group=self.group,
+            image='',
+        )
+        mixer.blend('posts.Comment', post=post)
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserCounters.objects.filter(user=self.reader).delete()
+        UserCounters.objects.update(posts_count=7, followers_count=7)
+        Post.objects.update(comments_count=7)
+        Group.objects.update(posts_count=7)
+        out = StringIO()
+        call_command('recount_counters', stdout=out)
+        self.assertIn('(новых: 1)', out.getvalue())
+        self.assertEqual(self.counters(self.author), (1, 1, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 1))
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count,
+            0,
+        )
+
+    def test_save_of_stale_instance_keeps_counters(self):
+        post = mixer.blend(
+            'posts.Post',
+            author=self.author,
+            group=self.group,
+            image='',
+        )
+        stale_post = Post.objects.get(pk=post.pk)
+        stale_group = Group.objects.get(pk=self.group.pk)
+        mixer.blend('posts.Comment', post=post)
+        mixer.blend('posts.Post', group=self.group, image='')
+        stale_post.text = 'Новый текст'
+        stale_post.save()
+        stale_group.title = 'Новое название'
+        stale_group.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 2)
+
+    def test_missing_counters_row_is_created_on_profile(self):
+        mixer.blend('posts.Post', author=self.author, image='')
+        UserCounters.objects.filter(user=self.author).delete()
+        cache.clear()
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.author)[0], 1)
@@ -0,0 +1,234 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from core.utils import FEED_ORDERING, paginate
+from posts import feeds
+from posts.models import FeedEntry, Follow, Post
+
+User = get_user_model()
+
+
+class FanOutFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.author, cls.other = mixer.cycle(3).blend(User)
+        cls.old_posts = mixer.cycle(3).blend('posts.Post', author=cls.author)
+        mixer.blend('posts.Post', author=cls.other)
+
+        cls.auth = Client()
+        cls.auth.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_follow_backfills_author_posts(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            set(
+                FeedEntry.objects.filter(user=self.reader).values_list(
+                    'post',
+                    flat=True,
+                ),
+            ),
+            {post.pk for post in self.old_posts},
+        )
+
+    def test_new_post_is_pushed_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = mixer.blend('posts.Post', author=self.author)
+        entry = FeedEntry.objects.get(user=self.reader, post=post)
+        self.assertEqual(entry.pub_date, post.pub_date)
+        self.assertEqual(entry.author, self.author)
+
+    def test_unfollow_purges_author_posts(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.other)
+        follow.delete()
+        self.assertFalse(
+            FeedEntry.objects.filter(
+                user=self.reader,
+                author=self.author,
+            ).exists(),
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=self.reader,
+                author=self.other,
+            ).exists(),
+        )
+
+    def test_follow_index_lists_timeline_posts(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            sorted(
+                self.old_posts,
+                key=lambda post: (post.pub_date, post.pk),
+                reverse=True,
+            ),
+        )
+
+
+@override_settings(
+    FEED_CELEBRITY_FOLLOWERS=2,
+    FEED_CELEBRITY_DEMOTE_FOLLOWERS=1,
+)
+class HybridFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.fan, cls.star, cls.author = mixer.cycle(4).blend(
+            User,
+        )
+        for user in (cls.reader, cls.fan):
+            Follow.objects.create(user=user, author=cls.star)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        call_command('feed_split', rebalance=True, stdout=StringIO())
+
+        cls.auth = Client()
+        cls.auth.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_celebrity_posts_are_pulled_not_pushed(self):
+        post = mixer.blend('posts.Post', author=self.star)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_feed_merges_pushed_and_pulled_posts_in_order(self):
+        for index in range(6):
+            mixer.blend(
+                'posts.Post',
+                author=(self.star, self.author)[index % 2],
+            )
+        feed = feeds.follow_feed(self.reader)
+        self.assertEqual(
+            feed[0:6],
+            list(
+                Post.objects.filter(
+                    author__in=(self.star, self.author),
+                ).order_by(*FEED_ORDERING),
+            ),
+        )
+        request = RequestFactory().get('/')
+        first = paginate(request, feed, 4, cursor=True)
+        request = RequestFactory().get('/', {'after': first.next_cursor})
+        second = paginate(request, feed, 4, cursor=True)
+        self.assertEqual(list(first) + list(second), feed[0:6])
+
+    def rebalance(self):
+        call_command('feed_split', rebalance=True, stdout=StringIO())
+
+    def test_crossing_threshold_is_rebalanced_by_command(self):
+        post = mixer.blend('posts.Post', author=self.author)
+        self.assertTrue(FeedEntry.objects.filter(post=post).exists())
+        follow = Follow.objects.create(user=self.fan, author=self.author)
+        self.assertTrue(FeedEntry.objects.filter(post=post).exists())
+        self.rebalance()
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        self.assertTrue(feeds.is_celebrity(self.author.pk))
+        follow.delete()
+        self.rebalance()
+        self.assertTrue(feeds.is_celebrity(self.author.pk))
+        self.assertIn(
+            post,
+            self.auth.get(reverse('posts:follow_index')).context['page_obj'],
+        )
+        with self.settings(FEED_CELEBRITY_DEMOTE_FOLLOWERS=2):
+            self.rebalance()
+        self.assertFalse(feeds.is_celebrity(self.author.pk))
+        self.assertTrue(
+            FeedEntry.objects.filter(post=post, user=self.reader).exists(),
+        )
+
+    def test_feed_split_reports_write_amplification(self):
+        mixer.blend('posts.Post', author=self.star)
+        mixer.blend('posts.Post', author=self.author)
+        out = StringIO()
+        call_command('feed_split', stdout=out)
+        self.assertIn('Записей в ленты на пост: 0.5', out.getvalue())
+        self.assertIn('при раздаче всех авторов 1.5', out.getvalue())
+
+
+@override_settings(FOLLOW_FEED_ENGINE='merge', FEED_STREAM_SIZE=3)
+class AuthorMergeFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, *cls.authors = mixer.cycle(4).blend(User)
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            mixer.cycle(5).blend('posts.Post', author=author)
+        mixer.cycle(2).blend('posts.Post')
+
+        cls.auth = Client()
+        cls.auth.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self):
+        return list(
+            Post.objects.filter(author__following__user=self.reader).order_by(
+                *FEED_ORDERING,
+            ),
+        )
+
+    def test_cursor_walk_matches_join_in_both_directions(self):
+        feed = feeds.follow_feed(self.reader)
+        pages = [paginate(RequestFactory().get('/'), feed, 4, cursor=True)]
+        while pages[-1].has_next():
+            request = RequestFactory().get(
+                '/',
+                {'after': pages[-1].next_cursor},
+            )
+            pages.append(paginate(request, feed, 4, cursor=True))
+        self.assertEqual(
+            [post for page in pages for post in page],
+            self.expected(),
+        )
+        request = RequestFactory().get(
+            '/',
+            {'before': pages[-1].previous_cursor},
+        )
+        self.assertEqual(
+            list(paginate(request, feed, 4, cursor=True)),
+            list(pages[-2]),
+        )
+
+    def test_new_post_invalidates_cached_stream(self):
+        self.auth.get(reverse('posts:follow_index'))
+        post = mixer.blend('posts.Post', author=self.authors[0])
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_follow_index_pages_by_cursor(self):
+        first = self.auth.get(reverse('posts:follow_index'))
+        page_obj = first.context['page_obj']
+        self.assertTrue(page_obj.is_cursor)
+        response = self.auth.get(
+            reverse('posts:follow_index'),
+            {'after': page_obj.next_cursor},
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            self.expected()[10:15],
+        )
+
+    @override_settings(CURSOR_PAGINATED_VIEWS=())
+    def test_numbered_pages_match_join(self):
+        response = self.auth.get(reverse('posts:follow_index'), {'page': 2})
+        self.assertEqual(
+            list(response.context['page_obj']),
+            self.expected()[10:15],
+        )
@@ -1,10 +1,13 @@
+from io import BytesIO
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.views import redirect_to_login
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from faker import Faker
 from mixer.backend.django import mixer
 
+from posts.forms import PostForm
 from posts.models import Comment, Follow, Post
 from posts.tests import common
 
@@ -12,6 +15,16 @@ User = get_user_model()
 fake = Faker()
 
 
+class ReadCounter(BytesIO):
+    bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
 class PostsFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -53,6 +66,42 @@ class PostsFormTests(TestCase):
         )
         self.assertIsNotNone(post.image)
 
+    @override_settings(IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_create_post_with_oversized_image(self):
+        response = self.auth.post(
+            reverse('posts:post_create'),
+            data={'text': 'Тестовый текст', 'image': common.picture()},
+        )
+        self.assertFormError(
+            response,
+            'form',
+            'image',
+            'Размер файла не должен превышать 100\xa0байт.',
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_image_is_checked_by_header(self):
+        upload = common.picture('big.jpg', size=(4000, 3000))
+        upload.file = ReadCounter(upload.file.getvalue())
+        form = PostForm(
+            data={'text': 'Тестовый текст'},
+            files={'image': upload},
+        )
+        self.assertTrue(form.is_valid())
+        self.assertLess(upload.file.bytes_read, upload.size // 10)
+        self.assertEqual(form.cleaned_data['image'].image.size, (4000, 3000))
+
+    def test_create_post_with_broken_image(self):
+        form = PostForm(
+            data={'text': 'Тестовый текст'},
+            files={'image': common.image()},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code,
+            'invalid_image',
+        )
+
     def test_edit_post_by_author(self):
         self.author_user = mixer.blend(User)
         self.auth_author = Client()
@@ -1,8 +1,16 @@
+from unittest import skipUnless
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from mixer.backend.django import mixer
 
+from posts.models import Follow
+
 User = get_user_model()
 
 
@@ -56,3 +64,63 @@ class FollowModelTest(TestCase):
             f'{self.follow.user} подписан на {self.follow.author}',
             str(self.follow),
         )
+
+    def test_follow_is_unique_per_user_and_author(self):
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(
+                user=self.follow.user,
+                author=self.follow.author,
+            )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+class ListingQueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = mixer.cycle(2).blend(User)
+        cls.group = mixer.blend('posts.Group')
+        cls.post = mixer.cycle(3).blend(
+            'posts.Post',
+            author=cls.user[0],
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.user[1], author=cls.user[0])
+
+        cls.auth = Client()
+        cls.auth.force_login(cls.user[1])
+
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+            reverse('posts:profile', args=(cls.user[0].username,)),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_sorted_by_index(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.auth.get(url)
+        sorted_selects = [
+            query['sql']
+            for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'ORDER BY' in query['sql']
+        ]
+        self.assertTrue(sorted_selects, url)
+        with connection.cursor() as cursor:
+            for sql in sorted_selects:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                with self.subTest(url=url, sql=sql):
+                    self.assertIn('INDEX', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_listings_use_indexes_for_ordering(self):
+        for url in self.urls:
+            self.assert_sorted_by_index(url)
+
+    @override_settings(FOLLOW_FEED_ENGINE='merge')
+    def test_merge_engine_uses_author_index(self):
+        self.assert_sorted_by_index(reverse('posts:follow_index'))
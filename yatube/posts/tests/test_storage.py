@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from mixer.backend.django import mixer
+
+from posts.models import MediaFile, Post
+from posts.storage import image_storage
+from posts.tests import common
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        self.author = mixer.blend(User)
+
+    def create_post(self, name: str) -> Post:
+        return Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=common.picture(name),
+        )
+
+    def test_identical_uploads_share_one_sharded_file(self):
+        first = self.create_post('first.png')
+        second = self.create_post('second.png')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(image_storage.is_addressed(first.image.name))
+        digest = first.image.name.split('/')[-1]
+        self.assertEqual(
+            first.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}',
+        )
+        self.assertEqual(MediaFile.objects.get().refs, 2)
+
+    def test_file_is_deleted_with_last_reference(self):
+        first = self.create_post('first.png')
+        second = self.create_post('second.png')
+        name = first.image.name
+        first.delete()
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+        second.delete()
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_replaced_image_is_released(self):
+        post = self.create_post('first.png')
+        name = post.image.name
+        post.image = common.picture('other.png', (300, 300))
+        post.save()
+        self.assertNotEqual(post.image.name, name)
+        self.assertFalse(image_storage.exists(name))
+
+    def test_reupload_of_same_image_keeps_one_reference(self):
+        post = self.create_post('first.png')
+        name = post.image.name
+        post.image = common.picture('again.png')
+        post.save()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+
+    def test_save_racing_last_delete_keeps_file(self):
+        post = self.create_post('first.png')
+        name = post.image.name
+        acquire = image_storage.acquire
+
+        def acquire_after_delete(name: str, count: int = 1) -> None:
+            # Последнюю ссылку снимают параллельно с сохранением копии.
+            image_storage.delete(name)
+            acquire(name, count)
+
+        with mock.patch.object(image_storage, 'acquire', acquire_after_delete):
+            self.assertEqual(
+                image_storage.save(name, common.picture('second.png')),
+                name,
+            )
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
@@ -0,0 +1,177 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from mixer.backend.django import mixer
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores import dbm_kvstore
+
+from posts import images, thumbnails
+from posts.models import Post
+from posts.tests import common
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+DBM_FILE = Path(tempfile.mkdtemp()) / 'kvstore'
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(DBM_FILE.parent, ignore_errors=True)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    THUMBNAIL_DBM_FILE=DBM_FILE,
+    THUMBNAIL_WORKERS=0,
+)
+class EagerThumbnailTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear()
+        self.user = mixer.blend(User)
+        self.auth = Client()
+        self.auth.force_login(self.user)
+
+    def test_upload_generates_thumbnail(self):
+        self.auth.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': common.picture()},
+        )
+        post = Post.objects.get()
+        thumbnail = thumbnails.ready_thumbnail(post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+
+    def test_card_lists_width_variants(self):
+        self.auth.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': common.picture()},
+        )
+        post = Post.objects.get()
+        variants = thumbnails.ready_variants(post.image)
+        response = self.client.get(reverse('posts:index'))
+        srcset = ', '.join(
+            f'{variants[width].url} {width}w'
+            for width in thumbnails.CARD_WIDTHS
+        )
+        self.assertContains(response, f'srcset="{srcset}"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
+    @override_settings(IMAGE_MAX_SIDE=400)
+    def test_upload_is_recompressed(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        self.auth.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с фотографией',
+                'image': common.picture('photo.jpg', (1200, 900), exif=exif),
+            },
+        )
+        post = Post.objects.get()
+        extension = images.EXTENSIONS[images.output_format()]
+        self.assertTrue(post.image.name.endswith(extension))
+        self.assertFalse(default_storage.exists('posts/photo.jpg'))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (400, 300))
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertEqual((post.image_width, post.image_height), (400, 300))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'),
+        )
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+
+    def test_store_survives_cache_loss(self):
+        post = mixer.blend(
+            'posts.Post',
+            author=self.user,
+            image=common.picture(),
+        )
+        thumbnails.generate(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+        self.assertEqual(len(queries), 0)
+
+    def test_thumbnail_from_pool_is_seen_after_miss(self):
+        post = mixer.blend(
+            'posts.Post',
+            author=self.user,
+            image=common.picture(),
+        )
+        self.assertIsNone(thumbnails.ready_thumbnail(post.image))
+        with override_settings(THUMBNAIL_WORKERS=1):
+            try:
+                thumbnails.executor().submit(
+                    thumbnails.generate,
+                    post.image.name,
+                ).result()
+            finally:
+                thumbnails.executor().shutdown()
+                thumbnails._executor = None
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+
+    def test_pending_thumbnail_falls_back_to_original(self):
+        with override_settings(THUMBNAIL_WORKERS=1):
+            cache.add('thumbnail_job:posts/pending.png', True)
+            post = mixer.blend(
+                'posts.Post',
+                author=self.user,
+                image='posts/pending.png',
+                image_width=640,
+                image_height=480,
+            )
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response,
+            f'src="{post.image.url}" width="640" height="480"',
+        )
+        self.assertIsNone(thumbnails.ready_thumbnail(post.image))
+
+
+@override_settings(THUMBNAIL_DBM_FILE=DBM_FILE, THUMBNAIL_WORKERS=0)
+class BatchedThumbnailLookupTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear()
+        author = mixer.blend(User)
+        for number in range(5):
+            cache.add(f'thumbnail_job:posts/{number}.png', True)
+            mixer.blend(
+                'posts.Post',
+                author=author,
+                image=f'posts/{number}.png',
+            )
+
+    def test_listing_reads_kvstore_once(self):
+        with mock.patch.object(
+            dbm_kvstore,
+            'DBMContext',
+            wraps=dbm_kvstore.DBMContext,
+        ) as store:
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(store.call_count, 1)
+
+    def test_resolved_thumbnails_are_attached(self):
+        posts = list(Post.objects.all())
+        thumbnails.resolve_thumbnails(posts)
+        for post in posts:
+            self.assertEqual(
+                post.thumbnails,
+                dict.fromkeys(thumbnails.CARD_WIDTHS),
+            )
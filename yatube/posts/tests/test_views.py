@@ -2,13 +2,15 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from faker import Faker
 from mixer.backend.django import mixer
 
 from posts.models import Follow, Post
 
 User = get_user_model()
+fake = Faker()
 
 
 class PostsViewsTests(TestCase):
@@ -125,16 +127,19 @@ class PostsViewsTests(TestCase):
                 'posts/post_detail.html',
             ):
                 response = self.auth.get(reverse_name)
+                post = response.context.get('post')
+                if 'page_obj' in response.context:
+                    post = response.context['page_obj'][0]
                 self.assertEqual(
-                    response.context.get('post').author,
+                    post.author,
                     self.post.author,
                 )
                 self.assertEqual(
-                    response.context.get('post').pub_date,
+                    post.pub_date,
                     self.post.pub_date,
                 )
                 self.assertEqual(
-                    response.context.get('post').text,
+                    post.text,
                     self.post.text,
                 )
 
@@ -233,20 +238,92 @@ class PostsViewsTests(TestCase):
 
     def test_index_page_cache(self):
         response_one = self.client.get(reverse('posts:index'))
-        response_one.context['page_obj'][0].delete()
-        Post.objects.create(
-            text='text',
-            author=self.user[0],
-            group=self.group[0],
-        )
         response_two = self.client.get(reverse('posts:index'))
+        self.assertIsNone(response_two.context)
         self.assertEqual(response_one.content, response_two.content)
         cache.clear()
         response_three = self.client.get(reverse('posts:index'))
-        self.assertNotEqual(
-            response_two.content,
-            response_three.content,
+        self.assertIsNotNone(response_three.context)
+
+    def test_listing_cache_reflects_writes_immediately(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group[0].slug,)),
+            reverse('posts:profile', args=(self.user[0].username,)),
+        )
+        for url in urls:
+            self.client.get(url)
+        post = Post.objects.create(
+            text=fake.sentence(),
+            author=self.user[0],
+            group=self.group[0],
         )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), post.text)
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), post.text)
+
+    def test_group_change_expires_previous_group_page(self):
+        post = Post.objects.create(
+            text=fake.sentence(),
+            author=self.user[0],
+            group=self.group[0],
+        )
+        url = reverse('posts:group_list', args=(self.group[0].slug,))
+        self.assertContains(self.client.get(url), post.text)
+        post.group = self.group[1]
+        post.save()
+        self.assertNotContains(self.client.get(url), post.text)
+
+    def test_renamed_group_leaves_previous_page(self):
+        group = mixer.blend('posts.Group', slug='before')
+        mixer.blend('posts.Post', author=self.user[0], group=group, image='')
+        url = reverse('posts:group_list', args=('before',))
+        listings = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.user[0].username,)),
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+        for listing in listings:
+            self.assertContains(self.client.get(listing), url)
+        group.slug = 'after'
+        group.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        for listing in listings:
+            with self.subTest(listing=listing):
+                response = self.client.get(listing)
+                self.assertNotContains(response, url)
+                self.assertContains(
+                    response,
+                    reverse('posts:group_list', args=('after',)),
+                )
+
+    def test_deleted_group_leaves_listings(self):
+        group = mixer.blend('posts.Group', slug='gone')
+        mixer.blend('posts.Post', author=self.user[0], group=group, image='')
+        url = reverse('posts:group_list', args=('gone',))
+        self.assertContains(self.client.get(reverse('posts:index')), url)
+        group.delete()
+        self.assertNotContains(self.client.get(reverse('posts:index')), url)
+
+    def test_renamed_author_leaves_previous_profile(self):
+        author = mixer.blend(User, username='before')
+        url = reverse('posts:profile', args=('before',))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        author.username = 'after'
+        author.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get(reverse('posts:profile', args=('after',)))
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_expires_followers_profile_page(self):
+        url = reverse('posts:profile', args=(self.user[0].username,))
+        self.assertContains(self.auth.get(url), 'Подписаться')
+        Follow.objects.create(user=self.user[1], author=self.user[0])
+        self.assertContains(self.auth.get(url), 'Отписаться')
 
 
 class PaginatorViewsTest(TestCase):
@@ -287,3 +364,282 @@ class PaginatorViewsTest(TestCase):
                 len(response.context.get('page_obj')),
                 settings.PAGE_SIZE,
             )
+
+
+class ListingQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.author = mixer.cycle(2).blend(User)
+        cls.group = mixer.blend('posts.Group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for group in mixer.cycle(settings.PAGE_SIZE).blend('posts.Group'):
+            mixer.blend(
+                'posts.Post',
+                author=cls.author,
+                group=group,
+                image='',
+            )
+            mixer.blend('posts.Post', group=cls.group, image='')
+
+        cls.auth = Client()
+        cls.auth.force_login(cls.reader)
+
+        cls.budgets = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_list', args=(cls.group.slug,)): 4,
+            reverse('posts:profile', args=(cls.author.username,)): 4,
+            reverse('posts:follow_index'): 4,
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listings_fit_query_budget(self):
+        for url, budget in self.budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                self.auth.get(url)
+
+
+class ProfileHeaderTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.author = mixer.cycle(2).blend(User)
+        mixer.cycle(3).blend('posts.Post', author=cls.author, image='')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.auth = Client()
+        cls.auth.force_login(cls.reader)
+        cls.url = reverse('posts:profile', args=(cls.author.username,))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_header_takes_one_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        author = response.context['author']
+        self.assertFalse(author.is_followed)
+        self.assertEqual(author.counters.posts_count, 3)
+        self.assertEqual(author.counters.followers_count, 1)
+
+    def test_header_knows_follower(self):
+        response = self.auth.get(self.url)
+        self.assertTrue(response.context['following'])
+        self.assertContains(response, 'Отписаться')
+
+    def test_cached_header_checks_follower(self):
+        self.client.get(self.url)
+        response = self.auth.get(self.url)
+        self.assertTrue(response.context['following'])
+
+    def test_unfollow_without_follow_is_not_found(self):
+        Follow.objects.all().delete()
+        response = self.auth.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)),
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=5)
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = mixer.blend('posts.Post', image='')
+        cls.comments = mixer.cycle(12).blend('posts.Comment', post=cls.post)
+        cls.auth = Client()
+        cls.auth.force_login(mixer.blend(User))
+
+    def comment_pks(self, response):
+        return [comment.pk for comment in response.context['comments']]
+
+    def test_post_detail_fits_query_budget(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(3):
+            self.auth.get(url)
+
+    def test_fragments_cover_thread_without_gaps(self):
+        expected = [comment.pk for comment in reversed(self.comments)]
+        for order in ('newest', 'oldest'):
+            with self.subTest(order=order):
+                response = self.client.get(
+                    reverse('posts:post_detail', args=(self.post.pk,)),
+                    {'order': order},
+                )
+                seen = self.comment_pks(response)
+                while response.context['comments'].has_next():
+                    response = self.client.get(
+                        reverse('posts:post_comments', args=(self.post.pk,)),
+                        {
+                            'order': order,
+                            'after': response.context['comments'].next_cursor,
+                        },
+                    )
+                    self.assertTemplateUsed(response, 'includes/comments.html')
+                    self.assertTemplateNotUsed(response, 'base.html')
+                    seen.extend(self.comment_pks(response))
+                self.assertEqual(
+                    seen,
+                    expected if order == 'newest' else expected[::-1],
+                )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = mixer.blend(User)
+        cls.posts = mixer.cycle(3).blend(
+            'posts.Post',
+            author=cls.author,
+            image='',
+        )
+
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_cards_skip_card_template(self):
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        self.assertTemplateNotUsed(response, 'includes/post.html')
+        for post in self.posts:
+            self.assertContains(response, post.text)
+
+    def test_post_edit_refreshes_card(self):
+        post = self.posts[0]
+        self.client.get(reverse('posts:index'))
+        self.author_client.post(
+            reverse('posts:post_edit', args=(post.pk,)),
+            data={'text': 'Обновлённый текст'},
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Обновлённый текст')
+        self.assertNotContains(response, post.text)
+
+    def test_author_rename_refreshes_cards(self):
+        self.client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name, author.last_name = 'Новое', 'Имя'
+        author.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новое Имя', count=len(self.posts))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = mixer.blend(User)
+        cls.group = mixer.blend('posts.Group')
+        cls.post = mixer.blend(
+            'posts.Post',
+            author=cls.author,
+            group=cls.group,
+            image='',
+        )
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+            reverse('posts:profile', args=(cls.author.username,)),
+            reverse('posts:post_detail', args=(cls.post.pk,)),
+        )
+        cls.auth = Client()
+        cls.auth.force_login(mixer.blend(User))
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_page_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_etag_depends_on_user(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.auth.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                response = self.revalidate(self.auth, url)
+                self.assertEqual(response.status_code, 304)
+
+    def assertChangeInvalidates(self, change, urls):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        change()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code,
+                    200 if url in urls else 304,
+                )
+
+    def test_comment_invalidates_post_page(self):
+        self.assertChangeInvalidates(
+            lambda: mixer.blend('posts.Comment', post=self.post),
+            self.urls[-1:],
+        )
+
+    def test_new_post_invalidates_all_pages(self):
+        self.assertChangeInvalidates(
+            lambda: mixer.blend(
+                'posts.Post',
+                author=self.author,
+                group=self.group,
+                image='',
+            ),
+            self.urls,
+        )
+
+    def test_neighbour_edit_keeps_post_page(self):
+        other = mixer.blend(
+            'posts.Post',
+            author=self.author,
+            group=self.group,
+            image='',
+        )
+        self.assertChangeInvalidates(
+            lambda: Post.objects.get(pk=other.pk).save(),
+            self.urls[:-1],
+        )
+
+    def test_rename_invalidates_post_page(self):
+        def rename():
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+
+        self.assertChangeInvalidates(rename, self.urls)
+
+    def test_unsafe_request_is_not_revalidated(self):
+        url = self.urls[-1]
+        etag = self.client.get(url)['ETag']
+        response = self.client.post(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_edit_invalidates_all_pages(self):
+        self.assertChangeInvalidates(
+            lambda: Post.objects.get(pk=self.post.pk).save(),
+            self.urls,
+        )
@@ -0,0 +1,286 @@
+"""Миниатюры картинок постов, которые готовятся заранее в фоне.
+
+Страницы не генерируют миниатюры сами: они берут готовую из хранилища
+sorl, а пока её нет, выводят оригинал и ставят генерацию в пул процессов.
+Там же пережимаются только что загруженные картинки. Процессы пула должны
+видеть ту же базу; при settings.THUMBNAIL_WORKERS = 0, как в тестах с
+базой в памяти, задачи выполняются сразу в процессе запроса.
+"""
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.caching import bump_versions, forget_object
+from posts import images
+from posts.models import Post
+from posts.storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+CARD_WIDTH, CARD_HEIGHT = 960, 339
+CARD_WIDTHS = (320, 640, CARD_WIDTH)
+CARD_VARIANTS = {
+    width: f'{width}x{round(width * CARD_HEIGHT / CARD_WIDTH)}'
+    for width in CARD_WIDTHS
+}
+CARD_GEOMETRY = CARD_VARIANTS[CARD_WIDTH]
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+CARD_SIZES = f'(min-width: 1200px) {CARD_WIDTH}px, 100vw'
+
+Variants = Dict[int, Optional[ImageFile]]
+
+_executor = None
+
+
+class LookupBackend(ThumbnailBackend):
+    """Бэкенд sorl, который только вычисляет файлы миниатюр, не создавая
+    их."""
+
+    def thumbnail_file(
+        self,
+        file_: object,
+        geometry_string: str,
+        **options,
+    ) -> ImageFile:
+        """Возвращает файл миниатюры, не проверяя, создана ли она."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = LookupBackend()
+
+
+def ready_thumbnail(image: object) -> Optional[ImageFile]:
+    image_file = backend.thumbnail_file(image, CARD_GEOMETRY, **CARD_OPTIONS)
+    return lookup_many([image_file])[image_file.key]
+
+
+def lookup_many(image_files: List[ImageFile]) -> Variants:
+    """Ищет миниатюры в хранилище sorl одним чтением.
+
+    get_many() хранилищ из posts.kvstore не кэширует промахи, в отличие
+    от get() в cached_db sorl, поэтому миниатюра, созданная в процессе
+    пула, видна сразу, как только он её запишет.
+    """
+    store = default.kvstore
+    if hasattr(store, 'get_many'):
+        return store.get_many(image_files)
+    return {
+        image_file.key: store.get(image_file) for image_file in image_files
+    }
+
+
+def ready_variants(image: object) -> Variants:
+    """Готовые миниатюры картинки по ширине; None — ещё не создана."""
+    files = {
+        width: backend.thumbnail_file(image, geometry, **CARD_OPTIONS)
+        for width, geometry in CARD_VARIANTS.items()
+    }
+    found = lookup_many(list(files.values()))
+    return {
+        width: found[image_file.key] for width, image_file in files.items()
+    }
+
+
+def resolve_thumbnails(posts: Iterable[Post]) -> None:
+    """Находит готовые миниатюры постов одним обращением к хранилищу.
+
+    Результат сохраняется в атрибут thumbnails поста: словарь из ширины
+    в ImageFile или None, если миниатюры ещё нет.
+    """
+    files = {
+        (post, width): backend.thumbnail_file(
+            post.image,
+            geometry,
+            **CARD_OPTIONS,
+        )
+        for post in posts
+        if post.image
+        for width, geometry in CARD_VARIANTS.items()
+    }
+    found = lookup_many(list(files.values()))
+    for (post, width), image_file in files.items():
+        if not hasattr(post, 'thumbnails'):
+            post.thumbnails = {}
+        post.thumbnails[width] = found[image_file.key]
+
+
+def source_file(name: str) -> ImageFile:
+    return ImageFile(name, image_storage)
+
+
+def thumbnail_names(name: str) -> List[str]:
+    """Имена всех миниатюр картинки, независимо от того, созданы ли они."""
+    source = source_file(name)
+    return [
+        backend.thumbnail_file(source, geometry, **CARD_OPTIONS).name
+        for geometry in CARD_VARIANTS.values()
+    ]
+
+
+def generate(name: str) -> str:
+    for geometry in CARD_VARIANTS.values():
+        get_thumbnail(source_file(name), geometry, **CARD_OPTIONS)
+    return name
+
+
+def warm(name: str, force: bool = False) -> str:
+    """Проверяет миниатюры картинки и создаёт недостающие.
+
+    Args:
+        name (str): имя картинки в хранилище.
+        force (bool): пересоздать миниатюры, даже если они есть.
+
+    Returns:
+        `missing`, если нет самой картинки, `ready`, если все миниатюры
+        уже есть в хранилище и на диске, `created` или `failed`.
+    """
+    try:
+        if not image_storage.exists(name):
+            return 'missing'
+        variants = ready_variants(source_file(name)).values()
+        if not force and all(
+            thumbnail is not None and thumbnail.exists()
+            for thumbnail in variants
+        ):
+            return 'ready'
+        for thumbnail in variants:
+            if thumbnail is not None:
+                default.kvstore.delete(thumbnail, delete_thumbnails=False)
+        generate(name)
+    except Exception:
+        logger.exception('Миниатюра для %s не создана', name)
+        return 'failed'
+    # sorl не пробрасывает ошибки разбора картинки, а только не сохраняет
+    # миниатюру.
+    variants = ready_variants(source_file(name)).values()
+    created = all(thumbnail is not None for thumbnail in variants)
+    return 'created' if created else 'failed'
+
+
+def backfill(
+    name: str,
+    describe: bool = False,
+    force: bool = False,
+) -> Tuple[str, Optional[images.ProcessedImage]]:
+    """warm(), а для постов без размеров и заглушки ещё и describe()."""
+    status = warm(name, force)
+    if not describe or status == 'missing':
+        return status, None
+    try:
+        return status, images.describe(name)
+    except Exception:
+        logger.exception('Картинка %s не прочитана', name)
+        return 'failed', None
+
+
+def ingest(pk: int, name: str) -> str:
+    """Пережимает загруженную картинку поста и готовит её миниатюры.
+
+    Пост переключается на пережатую картинку с её размерами и заглушкой,
+    только если его картинку не успели сменить. Оригинал удаляется, если
+    не задан settings.IMAGE_KEEP_ORIGINAL.
+    """
+    try:
+        processed = images.recompress(name)
+    except Exception:
+        logger.exception('Картинка %s не пережата', name)
+        processed = None
+    if processed is not None:
+        switched = Post.objects.filter(pk=pk, image=name).update(
+            image=processed.name,
+            image_width=processed.width,
+            image_height=processed.height,
+            image_placeholder=processed.placeholder,
+            updated=timezone.now(),
+        )
+        forget_object(Post, pk)
+        if processed.name != name:
+            if not switched:
+                image_storage.delete(processed.name)
+                return name
+            if not settings.IMAGE_KEEP_ORIGINAL:
+                image_storage.delete(name)
+            name = processed.name
+    generate(name)
+    return name
+
+
+def init_worker() -> None:
+    django.setup()
+    connections.close_all()
+
+
+def executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            initializer=init_worker,
+        )
+    return _executor
+
+
+def _finished(future: Future, scopes: List[str]) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error('Миниатюра не создана: %s', error)
+        return
+    bump_versions(scopes)
+
+
+def schedule(post: Post, upload: bool = False) -> None:
+    """Ставит генерацию миниатюры поста в очередь после фиксации записи.
+
+    Для только что загруженной картинки (`upload`) перед этим она
+    пережимается функцией ingest(). Повторные вызовы для той же картинки
+    в течение settings.THUMBNAIL_JOB_TIMEOUT игнорируются. Когда миниатюра
+    готова, кэшированные ленты с постом сбрасываются, чтобы вместо
+    оригинала показать её.
+    """
+    from posts.signals import listing_scopes
+
+    name = post.image.name
+    # Одинаковые загрузки разных постов делят файл, но пережимаются
+    # каждая для своего поста.
+    job_key = f'{post.pk}:{name}' if upload else name
+    if not cache.add(
+        f'thumbnail_job:{job_key}',
+        True,
+        settings.THUMBNAIL_JOB_TIMEOUT,
+    ):
+        return
+    scopes = listing_scopes(post)
+    job = partial(ingest, post.pk) if upload else generate
+
+    def submit() -> None:
+        if not settings.THUMBNAIL_WORKERS:
+            job(name)
+            bump_versions(scopes)
+            return
+        executor().submit(job, name).add_done_callback(
+            partial(_finished, scopes=scopes),
+        )
+
+    transaction.on_commit(submit)
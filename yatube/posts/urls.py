@@ -10,6 +10,11 @@ urlpatterns = [
     path('follow/', views.follow_index, name='follow_index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('posts/<int:pk>/comment/', views.add_comment, name='add_comment'),
+    path(
+        'posts/<int:pk>/comments/',
+        views.post_comments,
+        name='post_comments',
+    ),
     path('posts/<int:pk>/edit/', views.post_edit, name='post_edit'),
     path(
         'profile/<str:username>/follow/',
@@ -1,17 +1,27 @@
+from typing import Optional
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse
+from django.db.models import Exists, OuterRef, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
 
-from core.utils import paginate
+from core.caching import (
+    cache_listing,
+    cached_object,
+    cached_object_or_404,
+    revalidate,
+)
+from core.utils import CursorPage, paginate
+from posts import counters, feeds, thumbnails
 from posts.forms import CommentForm, PostForm
-from posts.models import Follow, Group, Post, User
+from posts.models import Follow, Group, Post, User, UserCounters
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_listing('index', 'users', 'groups')
 def index(request: HttpRequest) -> HttpResponse:
-    posts = Post.objects.select_related('author', 'group')
+    posts = Post.objects.for_feed()
     return render(
         request,
         'posts/index.html',
@@ -19,14 +29,16 @@ def index(request: HttpRequest) -> HttpResponse:
             'page_obj': paginate(
                 request,
                 posts,
+                scope='index',
             ),
         },
     )
 
 
+@cache_listing('group:{slug}', 'users', 'groups')
 def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    group = cached_object_or_404(Group, slug=slug)
+    posts = group.posts.for_feed()
     return render(
         request,
         'posts/group_list.html',
@@ -35,30 +47,76 @@ def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
             'page_obj': paginate(
                 request,
                 posts,
+                scope=f'group:{group.pk}',
             ),
         },
     )
 
 
-def profile(request: HttpRequest, username: str) -> HttpResponse:
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(
-            author=author,
-            user=request.user,
-        ).exists()
+def cached_author(
+    queryset: Optional[QuerySet] = None,
+    **lookup: object,
+) -> User:
+    """Автор со счётчиками из кэша объектов."""
+    author = cached_object_or_404(
+        User,
+        related=('counters',),
+        queryset=queryset,
+        **lookup,
     )
+    author.counters = cached_object(
+        UserCounters,
+        pk=author.pk,
+    ) or counters.counters_for(author.pk)
+    return author
+
+
+def profile_header(request: HttpRequest, username: str) -> User:
+    """Автор для шапки профиля.
+
+    Автор и его счётчики постов и подписчиков берутся из кэша объектов.
+    В атрибуте `is_followed` — подписан ли на автора текущий
+    пользователь: при промахе это подзапрос EXISTS в том же запросе,
+    что заполняет кэш, а при попадании — отдельный запрос, и только
+    для авторизованного.
+    """
+    authors = User.objects.all()
+    if request.user.is_authenticated:
+        authors = authors.annotate(
+            is_followed=Exists(
+                Follow.objects.filter(
+                    author=OuterRef('pk'),
+                    user=request.user,
+                ),
+            ),
+        )
+    author = cached_author(authors, username=username)
+    if not hasattr(author, 'is_followed'):
+        author.is_followed = (
+            request.user.is_authenticated
+            and Follow.objects.filter(
+                author=author,
+                user=request.user,
+            ).exists()
+        )
+    return author
+
+
+@cache_listing('author:{username}', 'groups')
+def profile(request: HttpRequest, username: str) -> HttpResponse:
+    author = profile_header(request, username)
+    posts = author.posts.for_feed()
     return render(
         request,
         'posts/profile.html',
         {
             'author': author,
-            'following': following,
+            'following': author.is_followed,
             'page_obj': paginate(
                 request,
                 posts,
+                scope=f'author:{author.pk}',
+                count=author.counters.posts_count,
             ),
         },
     )
@@ -66,10 +124,12 @@ def profile(request: HttpRequest, username: str) -> HttpResponse:
 
 @login_required
 def post_create(request: HttpRequest) -> HttpResponse:
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         form.instance.author = request.user
-        form.save()
+        post = form.save()
+        if post.image:
+            thumbnails.schedule(post, upload=True)
         return redirect(
             reverse(
                 'posts:profile',
@@ -82,7 +142,12 @@ def post_create(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def post_edit(request: HttpRequest, pk: int) -> HttpResponse:
-    post = get_object_or_404(Post, pk=pk)
+    # Сохраняется только свежая запись, иначе форма затрёт более новые
+    # значения старыми из кэша.
+    if request.method == 'POST':
+        post = get_object_or_404(Post, pk=pk)
+    else:
+        post = cached_object_or_404(Post, pk=pk)
     if post.author != request.user:
         return redirect('posts:post_detail', pk=pk)
     form = PostForm(
@@ -91,7 +156,9 @@ def post_edit(request: HttpRequest, pk: int) -> HttpResponse:
         instance=post,
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if post.image and 'image' in form.changed_data:
+            thumbnails.schedule(post, upload=True)
         return redirect('posts:post_detail', pk=pk)
     return render(
         request,
@@ -100,8 +167,39 @@ def post_edit(request: HttpRequest, pk: int) -> HttpResponse:
     )
 
 
+def comments_page(request: HttpRequest, post: Post) -> CursorPage:
+    """Страница комментариев поста, от новых или, при order=oldest, старых."""
+    return paginate(
+        request,
+        post.comments.select_related('author'),
+        settings.COMMENTS_PAGE_SIZE,
+        cursor=True,
+        oldest_first=request.GET.get('order') == 'oldest',
+    )
+
+
+def post_page_scopes(request: HttpRequest, pk: int) -> list:
+    """Области страницы поста: сам пост с комментариями, имена и группы.
+
+    Лент автора и группы здесь нет: их сбрасывают и правки соседних
+    постов, а со страницы видно только число постов автора — оно входит
+    в ETag через post_page_state.
+    """
+    return [f'post:{pk}', 'users', 'groups']
+
+
+def post_page_state(request: HttpRequest, pk: int) -> str:
+    """Число постов автора на странице поста, из тех же кэшей объектов."""
+    post = cached_object_or_404(Post, related=('author', 'group'), pk=pk)
+    return str(cached_author(pk=post.author_id).counters.posts_count)
+
+
+@revalidate(post_page_scopes, post_page_state)
 def post_detail(request: HttpRequest, pk: int) -> HttpResponse:
-    post = get_object_or_404(Post, pk=pk)
+    post = cached_object_or_404(Post, related=('author', 'group'), pk=pk)
+    post.author = cached_author(pk=post.author_id)
+    if post.group_id:
+        post.group = cached_object(Group, pk=post.group_id)
     form = CommentForm(request.POST or None)
     return render(
         request,
@@ -109,13 +207,27 @@ def post_detail(request: HttpRequest, pk: int) -> HttpResponse:
         {
             'post': post,
             'form': form,
+            'comments': comments_page(request, post),
+        },
+    )
+
+
+def post_comments(request: HttpRequest, pk: int) -> HttpResponse:
+    """Следующие комментарии поста фрагментом для кнопки «Показать ещё»."""
+    post = cached_object_or_404(Post, pk=pk)
+    return render(
+        request,
+        'includes/comments.html',
+        {
+            'post': post,
+            'comments': comments_page(request, post),
         },
     )
 
 
 @login_required
 def add_comment(request: HttpRequest, pk: int) -> HttpResponse:
-    post = get_object_or_404(Post, pk=pk)
+    post = cached_object_or_404(Post, pk=pk)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         form.instance.author = request.user
@@ -126,14 +238,13 @@ def add_comment(request: HttpRequest, pk: int) -> HttpResponse:
 
 @login_required
 def follow_index(request: HttpRequest) -> HttpResponse:
-    posts = Post.objects.filter(author__following__user=request.user)
     return render(
         request,
         'posts/follow.html',
         {
             'page_obj': paginate(
                 request,
-                posts,
+                feeds.follow_feed(request.user),
             ),
         },
     )
@@ -141,17 +252,16 @@ def follow_index(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def profile_follow(request: HttpRequest, username: str) -> HttpResponse:
-    author = get_object_or_404(User, username=username)
-    if request.user != author:
+    author = profile_header(request, username)
+    if request.user != author and not author.is_followed:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request: HttpRequest, username: str) -> HttpResponse:
-    get_object_or_404(
-        Follow,
-        author__username=username,
-        user=request.user,
-    ).delete()
+    author = profile_header(request, username)
+    if not author.is_followed:
+        raise Http404
+    Follow.objects.filter(author=author, user=request.user).delete()
     return redirect('posts:profile', username=username)
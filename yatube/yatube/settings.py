@@ -3,9 +3,14 @@ from decouple import config
 
 BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
 
+# Счётчики лент из refresh_feed_counts и поколения страниц видны всем
+# процессам только в общем кэше; LocMemCache годится для разработки.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10_000,
+        },
     },
 }
 
@@ -42,6 +47,13 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = str(BASE_DIR / 'media')
 
+# Без DEBUG файлы отдаёт веб-сервер: 'X-Accel-Redirect' или 'X-Sendfile'.
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -114,6 +126,59 @@ LANGUAGE_CODE = 'ru'
 
 PAGE_SIZE = 10
 
+COMMENTS_PAGE_SIZE = 20
+
+# Ленту подписок собирают из нескольких потоков, и OFFSET на дальних
+# страницах перебирает их все. Общие ленты остаются нумерованными: номера
+# страниц в них ищут поисковики и пользователи.
+CURSOR_PAGINATED_VIEWS = ('posts:follow_index',)
+
+FEED_COUNT_TIMEOUT = 60 * 60
+
+FEED_BATCH_SIZE = 1000
+
+FEED_CELEBRITY_FOLLOWERS = 10_000
+
+FEED_CELEBRITY_DEMOTE_FOLLOWERS = 8_000
+
+FOLLOW_FEED_ENGINE = 'timeline'
+
+FEED_STREAM_SIZE = 50
+
+FEED_STREAM_TIMEOUT = 60 * 60
+
+LISTING_CACHE_TIMEOUT = 60 * 60 * 6
+
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+OBJECT_CACHE_TIMEOUT = 60 * 15
+
+OBJECT_CACHE_MISS_TIMEOUT = 60
+
+THUMBNAIL_KVSTORE = 'posts.kvstore.CachedDBMKVStore'
+
+THUMBNAIL_DBM_FILE = str(BASE_DIR / 'thumbnail_kvstore')
+
+THUMBNAIL_WORKERS = 2
+
+THUMBNAIL_JOB_TIMEOUT = 60 * 10
+
+THUMBNAIL_BACKFILL_CHECKPOINT = str(BASE_DIR / 'thumbnails.checkpoint')
+
+IMAGE_FORMAT = 'WEBP'
+
+IMAGE_QUALITY = 80
+
+IMAGE_MAX_SIDE = 2560
+
+IMAGE_MAX_PIXELS = 40_000_000
+
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+IMAGE_KEEP_ORIGINAL = False
+
+IMAGE_PLACEHOLDER_SIZE = 16
+
 STRING_SIZE = 15
 
 TIME_ZONE = 'UTC'
@@ -4,6 +4,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import serve_media
+
 urlpatterns = [
     path(
         'about/',
@@ -39,3 +41,11 @@ if settings.DEBUG:
         settings.MEDIA_URL,
         document_root=settings.MEDIA_ROOT,
     )
+else:
+    urlpatterns += [
+        path(
+            f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+            serve_media,
+            name='media',
+        ),
+    ]